@@ -1,6 +1,135 @@
 import numpy as np
+from scipy import sparse
+from syndrome import qubit_stabilizer_adjacency
+from gf2 import GF2Solver
+import mh_kernels
+
+class CheckMatrixCache:
+    """
+    Parity-check matrices and qubit->stabilizer incidence tables, built once
+    per code instance and shared by every decoder, syndrome function and
+    sampler that asks for them. Expects n, X_stabilizers and Z_stabilizers.
+    """
+
+    def _cached(self, key, build):
+        cache = self.__dict__.setdefault('_check_cache', {})
+        if key not in cache:
+            cache[key] = build()
+        return cache[key]
 
-class ToricCode:
+    def stabilizer_matrices(self):
+        """Dense (HZ, HX). Cached and read-only; copy before modifying."""
+        def build():
+            HZ = np.zeros((len(self.Z_stabilizers), self.n), dtype=int)
+            HX = np.zeros((len(self.X_stabilizers), self.n), dtype=int)
+
+            for i, stab in enumerate(self.Z_stabilizers):
+                HZ[i, stab] = 1
+
+            for i, stab in enumerate(self.X_stabilizers):
+                HX[i, stab] = 1
+
+            HZ.setflags(write=False)
+            HX.setflags(write=False)
+            return HZ, HX
+        return self._cached('dense', build)
+
+    def parity_check_matrices(self):
+        """(HZ, HX) as uint8 CSR matrices."""
+        def build():
+            return (_csr_from_stabilizers(self.Z_stabilizers, self.n),
+                    _csr_from_stabilizers(self.X_stabilizers, self.n))
+        return self._cached('csr', build)
+
+    def qubit_stabilizer_incidence(self):
+        """
+        (adjZ, adjX): (n, max_degree) arrays of the Z-/X-stabilizers acting
+        on each qubit, padded with -1.
+        """
+        def build():
+            return (qubit_stabilizer_adjacency(self.Z_stabilizers, self.n),
+                    qubit_stabilizer_adjacency(self.X_stabilizers, self.n))
+        return self._cached('incidence', build)
+
+    def gf2_solvers(self):
+        """(solver_Z, solver_X): factored GF2Solver for HZ and HX."""
+        def build():
+            HZ, HX = self.parity_check_matrices()
+            return GF2Solver(HZ), GF2Solver(HX)
+        return self._cached('gf2', build)
+
+    def stabilizer_colour_classes(self):
+        """
+        (X_classes, Z_classes): partitions of the X- and Z-stabilizer indices
+        into classes with pairwise disjoint supports. Stabilizers are built in
+        row-major lattice order, so this is the (x + y) % 2 checkerboard
+        whenever the lattice allows it (a third class appears on odd toric L).
+        """
+        def build():
+            adjZ, adjX = self.qubit_stabilizer_incidence()
+            return (_colour_classes(self.X_stabilizers, adjX),
+                    _colour_classes(self.Z_stabilizers, adjZ))
+        return self._cached('colours', build)
+
+    def logical_indicators(self):
+        """
+        (LZ, LX): (2, n) uint8 indicator rows of (logical_Z_support,
+        logical_Z_conjugate) and (logical_X_support, logical_X_conjugate).
+        Cached and read-only.
+        """
+        def build():
+            out = []
+            for supports in ((self.logical_Z_support(), self.logical_Z_conjugate()),
+                             (self.logical_X_support(), self.logical_X_conjugate())):
+                M = np.zeros((2, self.n), dtype=np.uint8)
+                for i, s in enumerate(supports):
+                    M[i, s] = 1
+                M.setflags(write=False)
+                out.append(M)
+            return tuple(out)
+        return self._cached('logicals', build)
+
+    def support_table(self):
+        """
+        mh_kernels support table of all stabilizers, X-stabs first as in the
+        MH decoders' all_stabs. Cached and read-only.
+        """
+        def build():
+            table = mh_kernels.support_table(list(self.X_stabilizers) + list(self.Z_stabilizers))
+            table.setflags(write=False)
+            return table
+        return self._cached('support', build)
+
+    def stabilizer_neighbour_table(self):
+        """mh_kernels.neighbour_table of support_table(). Cached and read-only."""
+        def build():
+            table = mh_kernels.neighbour_table(self.support_table(), self.n)
+            table.setflags(write=False)
+            return table
+        return self._cached('neighbours', build)
+
+def _colour_classes(stabilizers, adjacency):
+    # Greedy colouring of the overlap graph in stabilizer order
+    colour = np.full(len(stabilizers), -1, dtype=np.int64)
+    for i, stab in enumerate(stabilizers):
+        neighbours = adjacency[stab].ravel()
+        used = set(colour[neighbours[neighbours >= 0]].tolist())
+        c = 0
+        while c in used:
+            c += 1
+        colour[i] = c
+    return [np.flatnonzero(colour == c) for c in range(colour.max() + 1)]
+
+def _csr_from_stabilizers(stabilizers, n):
+    indptr = np.zeros(len(stabilizers) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(stab) for stab in stabilizers])
+    indices = np.array([q for stab in stabilizers for q in stab], dtype=np.int64)
+    data = np.ones(len(indices), dtype=np.uint8)
+    H = sparse.csr_matrix((data, indices, indptr), shape=(len(stabilizers), n))
+    H.sort_indices()
+    return H
+
+class ToricCode(CheckMatrixCache):
     def __init__(self, L):
         self.L = L
         self.n = 2 * L * L
@@ -9,6 +138,10 @@ class ToricCode:
         self.X_stabilizers = self._build_stars()
         self.Z_stabilizers = self._build_faces()
 
+    def edge_index(self, x, y, vertical=False):
+        """Qubit index of the horizontal (or vertical) edge at lattice position (x, y), taken mod L."""
+        return self._edge_index_vert(x, y) if vertical else self._edge_index_hori(x, y)
+
     def _edge_index_hori(self, x, y):
         return self.hori_offset + (y % self.L) * self.L + (x % self.L)
 
@@ -56,20 +189,8 @@ class ToricCode:
     def logical_Z_conjugate(self):
         # Z2: Primal loop along X (Horizontal edges at y=0)
         return [self._edge_index_hori(x, 0) for x in range(self.L)]
-    
-    def stabilizer_matrices(self):
-        HZ = np.zeros((len(self.Z_stabilizers), self.n), dtype=int)
-        HX = np.zeros((len(self.X_stabilizers), self.n), dtype=int)
-
-        for i, stab in enumerate(self.Z_stabilizers):
-            HZ[i, stab] = 1
-
-        for i, stab in enumerate(self.X_stabilizers):
-            HX[i, stab] = 1
-
-        return HZ, HX
 
-class PlanarSurfaceCode:
+class PlanarSurfaceCode(CheckMatrixCache):
     def __init__(self, L):
         self.L = L
         self.num_hori = L * L
@@ -80,6 +201,10 @@ class PlanarSurfaceCode:
         self.X_stabilizers = self._build_stars()
         self.Z_stabilizers = self._build_faces()
 
+    def edge_index(self, x, y, vertical=False):
+        """Qubit index of the horizontal (or vertical, 1 <= x < L, y < L - 1) edge at lattice position (x, y)."""
+        return self._edge_index_vert(x, y) if vertical else self._edge_index_hori(x, y)
+
     def _edge_index_hori(self, x, y):
         return self.hori_offset + y * self.L + x
 
@@ -127,15 +252,3 @@ class PlanarSurfaceCode:
 
     def logical_Z_conjugate(self):
         return []
-    
-    def stabilizer_matrices(self):
-        HZ = np.zeros((len(self.Z_stabilizers), self.n), dtype=int)
-        HX = np.zeros((len(self.X_stabilizers), self.n), dtype=int)
-
-        for i, stab in enumerate(self.Z_stabilizers):
-            HZ[i, stab] = 1
-
-        for i, stab in enumerate(self.X_stabilizers):
-            HX[i, stab] = 1
-
-        return HZ, HX
\ No newline at end of file
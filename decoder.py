@@ -2,9 +2,30 @@ import utils
 import numpy as np  
 import itertools
 import random
-from MH_sampler import metropolis_hastings_on_stabilizers, metropolis_hastings_joint, metropolis_hastings_track_z, metropolis_hastings_avg_weight
+import os
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from MH_sampler import metropolis_hastings_on_stabilizers, metropolis_hastings_joint, metropolis_hastings_track_z, metropolis_hastings_avg_weight, metropolis_hastings_lockstep, metropolis_hastings_lockstep_track_z, checkerboard_classes, metropolis_hastings_checkerboard_avg_weight, metropolis_hastings_checkerboard_track_z, metropolis_hastings_tempering_avg_weight, temperature_ladder, metropolis_hastings_adaptive_avg_weight, metropolis_hastings_adaptive_track_z, metropolis_hastings_racing
+import mh_kernels
+import mh_multispin
+import tensor_network
 import ldpc
 
+MH_BACKENDS = ('python', 'compiled')
+TRACKZ_BACKENDS = MH_BACKENDS + ('multispin', 'checkerboard', 'nfold')
+PARALLEL_BACKENDS = MH_BACKENDS + ('lockstep', 'multispin', 'checkerboard', 'tempering', 'racing', 'nfold')
+# MHDecoderParallel backends whose per-class chains can run in the process pool
+POOL_BACKENDS = ('python', 'compiled', 'checkerboard', 'nfold')
+
+def _sweep_steps(decoder, n_proposals):
+    # Checkerboard steps with the same number of single-stabilizer proposals
+    return -(-n_proposals * len(decoder.colour_classes) // len(decoder.all_stabs))
+
+def _check_backend(backend, allowed):
+    if backend not in allowed:
+        raise ValueError(f"Unknown backend: {backend}. Expected one of {allowed}")
+    return backend
+
 class Decoder:
     def decode(self, syndZ, syndX):
         """
@@ -17,20 +38,153 @@ class Decoder:
         """
         raise NotImplementedError
 
+    def _setup_initializers(self, code, H=None, solvers=True):
+        """
+        Sets HZ, HX (code.stabilizer_matrices() unless H is given) and the
+        matching graphs and (with solvers) GF(2) solvers used to pick initial
+        corrections.
+        """
+        self.HZ, self.HX = code.stabilizer_matrices() if H is None else H
+        # Matching graphs are built once and reused for every decode
+        self.matching_Z = utils.build_matching(self.HZ)
+        self.matching_X = utils.build_matching(self.HX)
+        # Factored GF(2) solvers for the Gaussian-elimination initialization
+        if solvers:
+            self.solver_Z, self.solver_X = code.gf2_solvers()
+
+class CachedDecoder(Decoder):
+    def __init__(self, decoder, maxsize=4096):
+        """
+        Wraps any Decoder with a syndrome-keyed LRU cache.
+
+        Args:
+            decoder: The decoder to wrap.
+            maxsize: Maximum number of cached syndrome pairs.
+        """
+        self.decoder = decoder
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def _key(syndZ, syndX, kwargs=None):
+        # Bit-packed syndrome pair; the lengths disambiguate the padding.
+        # Decode options (e.g. init_method) change the result, so they are
+        # part of the key.
+        syndZ = np.asarray(syndZ, dtype=np.uint8)
+        syndX = np.asarray(syndX, dtype=np.uint8)
+        options = tuple(sorted((k, repr(v)) for k, v in (kwargs or {}).items()))
+        return (len(syndZ), np.packbits(syndZ).tobytes(), np.packbits(syndX).tobytes(), options)
+
+    def _lookup(self, key):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        return None
+
+    def _store(self, key, value):
+        self._cache[key] = value
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def decode(self, syndZ, syndX, **kwargs):
+        key = self._key(syndZ, syndX, kwargs)
+        cached = self._lookup(key)
+        if cached is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            eX_hat, eZ_hat = self.decoder.decode(syndZ, syndX, **kwargs)
+            cached = (np.array(eX_hat), np.array(eZ_hat))
+            self._store(key, cached)
+        return cached[0].copy(), cached[1].copy()
+
+    def decode_batch(self, syndZ_batch, syndX_batch):
+        """
+        Decodes each distinct syndrome pair in the batch at most once and
+        serves repeats (within the batch or from earlier calls) from the cache.
+        """
+        syndZ_batch = np.atleast_2d(np.asarray(syndZ_batch, dtype=np.uint8))
+        syndX_batch = np.atleast_2d(np.asarray(syndX_batch, dtype=np.uint8))
+        shots = syndZ_batch.shape[0]
+
+        # In-batch deduplication on the packed syndrome rows
+        packed = np.concatenate([np.packbits(syndZ_batch, axis=1), np.packbits(syndX_batch, axis=1)], axis=1)
+        _, first, inverse = np.unique(packed, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        results = [None] * len(first)
+        todo = []
+        for u, i in enumerate(first):
+            cached = self._lookup(self._key(syndZ_batch[i], syndX_batch[i]))
+            if cached is None:
+                todo.append(u)
+            results[u] = cached
+
+        if todo:
+            rows = first[todo]
+            if hasattr(self.decoder, 'decode_batch'):
+                eX_new, eZ_new = self.decoder.decode_batch(syndZ_batch[rows], syndX_batch[rows])
+            else:
+                decoded = [self.decoder.decode(syndZ_batch[i], syndX_batch[i]) for i in rows]
+                eX_new = [d[0] for d in decoded]
+                eZ_new = [d[1] for d in decoded]
+            for j, u in enumerate(todo):
+                results[u] = (np.array(eX_new[j]), np.array(eZ_new[j]))
+                self._store(self._key(syndZ_batch[first[u]], syndX_batch[first[u]]), results[u])
+
+        self.misses += len(todo)
+        self.hits += shots - len(todo)
+
+        eX_hat = np.array([r[0] for r in results], dtype=np.uint8)[inverse]
+        eZ_hat = np.array([r[1] for r in results], dtype=np.uint8)[inverse]
+        return eX_hat, eZ_hat
+
+    def cache_info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache), 'maxsize': self.maxsize}
+
+    def cache_clear(self):
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
 class MWPMDecoder(Decoder):
     def __init__(self, code):
-        # Precompute stabilizer matrices once
-        self.HZ, self.HX = code.stabilizer_matrices()
+        # Sparse parity-check matrices, cached on the code; matching needs no
+        # GF(2) solvers, whose dense factorization would dominate at large L
+        self._setup_initializers(code, code.parity_check_matrices(), solvers=False)
+        # Matching-graph edge -> qubit tables for decode_defects
+        self.edges_Z = utils.matching_edge_qubits(self.matching_Z) if self.matching_Z is not None else None
+        self.edges_X = utils.matching_edge_qubits(self.matching_X) if self.matching_X is not None else None
 
     def decode(self, syndZ, syndX):
         """
         Z syndromes -> X error estimate
         X syndromes -> Z error estimate
         """
-        eX_hat = utils.mwpm_initialize_e_given_syndrome(self.HZ, syndZ)
-        eZ_hat = utils.mwpm_initialize_e_given_syndrome(self.HX, syndX)
+        eX_hat = utils.mwpm_initialize_e_given_syndrome(self.HZ, syndZ, self.matching_Z)
+        eZ_hat = utils.mwpm_initialize_e_given_syndrome(self.HX, syndX, self.matching_X)
         return eX_hat, eZ_hat
 
+    def decode_batch(self, syndZ_batch, syndX_batch):
+        """
+        (shots, mZ), (shots, mX) syndromes -> (shots, n) eX_hat, eZ_hat.
+        """
+        eX_hat = utils.mwpm_decode_batch(self.HZ, syndZ_batch, self.matching_Z)
+        eZ_hat = utils.mwpm_decode_batch(self.HX, syndX_batch, self.matching_X)
+        return eX_hat, eZ_hat
+
+    def decode_defects(self, defectsZ, defectsX):
+        """
+        Sparse interface: takes defect index lists and returns the corrections
+        as flipped-qubit index lists (flipX_hat, flipZ_hat), without building
+        length-m syndromes or length-n corrections (utils.mwpm_decode_defects).
+        """
+        flipX_hat = utils.mwpm_decode_defects(self.HZ, defectsZ, self.matching_Z, self.edges_Z)
+        flipZ_hat = utils.mwpm_decode_defects(self.HX, defectsX, self.matching_X, self.edges_X)
+        return flipX_hat, flipZ_hat
+
 class MHDecoder(Decoder):
     def __init__(self, code, q_error, n_samples=2000, burn_in=500):
         self.code = code
@@ -39,7 +193,7 @@ class MHDecoder(Decoder):
         self.burn_in = burn_in
 
         # Stabilizer matrices
-        self.HZ, self.HX = code.stabilizer_matrices()
+        self._setup_initializers(code)
 
         # Precompute stabilizer vectors (for MH moves)
         self.Zstab_vecs = [self.HZ[i] for i in range(self.HZ.shape[0])]
@@ -48,11 +202,11 @@ class MHDecoder(Decoder):
     def decode(self, syndZ, syndX, init_method='MWPM'):
         # Initial solution via MWPM or Gaussian elimination
         if init_method == 'MWPM':
-            eX_init = utils.mwpm_initialize_e_given_syndrome(self.HZ, syndZ)
-            eZ_init = utils.mwpm_initialize_e_given_syndrome(self.HX, syndX)
+            eX_init = utils.mwpm_initialize_e_given_syndrome(self.HZ, syndZ, self.matching_Z)
+            eZ_init = utils.mwpm_initialize_e_given_syndrome(self.HX, syndX, self.matching_X)
         else:
-            eX_init = utils.ge_initialize_given_syndrome(self.HZ, syndZ)
-            eZ_init = utils.ge_initialize_given_syndrome(self.HX, syndX)
+            eX_init = self.solver_Z.solve(syndZ)
+            eZ_init = self.solver_X.solve(syndX)
 
         # MH refinement for X errors
         outX = metropolis_hastings_on_stabilizers(
@@ -79,12 +233,19 @@ class MHDecoder(Decoder):
         return outX['best_sample'], outZ['best_sample']
     
 class MHDecoderSingleChain(Decoder):
-    def __init__(self, code, q_error, n_samples=2000, burn_in=500):
+    def __init__(self, code, q_error, n_samples=2000, burn_in=500, backend='python'):
+        """
+        backend: 'python' runs the MH_sampler loops; 'compiled' runs the
+        mh_kernels versions (numba when installed) on a stabilizer support table.
+        """
         self.code = code
         self.q = q_error
         self.n_samples = n_samples
         self.burn_in = burn_in
-        self.HZ, self.HX = code.stabilizer_matrices()
+        self.backend = _check_backend(backend, MH_BACKENDS)
+        if self.backend == 'compiled':
+            self.support = code.support_table()
+        self._setup_initializers(code)
         
         # Precompute stabilizer vectors
         self.Zstab_vecs = [self.HZ[i] for i in range(self.HZ.shape[0])]
@@ -97,30 +258,64 @@ class MHDecoderSingleChain(Decoder):
     def decode(self, syndZ, syndX, init_method='MWPM'):
         # Initialize
         if init_method == 'MWPM':
-            eX = utils.mwpm_initialize_e_given_syndrome(self.HZ, syndZ)
-            eZ = utils.mwpm_initialize_e_given_syndrome(self.HX, syndX)
+            eX = utils.mwpm_initialize_e_given_syndrome(self.HZ, syndZ, self.matching_Z)
+            eZ = utils.mwpm_initialize_e_given_syndrome(self.HX, syndX, self.matching_X)
         else:
-            eX = utils.ge_initialize_given_syndrome(self.HZ, syndZ)
-            eZ = utils.ge_initialize_given_syndrome(self.HX, syndX)
+            eX = self.solver_Z.solve(syndZ)
+            eZ = self.solver_X.solve(syndX)
             
-        best_eX, best_eZ, _ = metropolis_hastings_joint(
-            eX, 
-            eZ, 
-            self.all_stabs, 
-            self.n_X_stabs, 
-            self.q, 
-            self.n_samples
-        )
+        if self.backend == 'compiled':
+            best_eX, best_eZ, _ = mh_kernels.metropolis_hastings_joint(
+                eX, eZ, self.support, self.n_X_stabs, self.q, self.n_samples
+            )
+        else:
+            best_eX, best_eZ, _ = metropolis_hastings_joint(
+                eX, 
+                eZ, 
+                self.all_stabs, 
+                self.n_X_stabs, 
+                self.q, 
+                self.n_samples
+            )
 
         return best_eX, best_eZ
 
 class MHDecoderTrackZ(Decoder):
-    def __init__(self, code, q_error, n_samples=2000, burn_in=500):
+    def __init__(self, code, q_error, n_samples=2000, burn_in=500, backend='python', adaptive=False):
+        """
+        backend: 'python' runs the MH_sampler loops; 'compiled' runs the
+        mh_kernels versions (numba when installed) on a stabilizer support table;
+        'multispin' runs 64 bit-sliced replicas of the chain
+        (mh_multispin) and averages their Z_ratios; 'checkerboard' updates a
+        whole colour class of non-overlapping stabilizers per step, with
+        n_samples and burn_in counted in single-stabilizer proposals; 'nfold'
+        runs the rejection-free compiled sampler (best at low p, where most
+        proposals are rejected).
+        adaptive: run lockstep replicas until the argmax class is settled
+        (MH_sampler.metropolis_hastings_adaptive_track_z), then as many steps
+        again for the Z ratios, with n_samples as the cap; this replaces the
+        backend's sampler.
+        last_n_steps holds the number of steps the last decode used and
+        last_scores its per-class Z_ratios.
+        """
         self.code = code
         self.q = q_error
         self.n_samples = n_samples
         self.burn_in = burn_in
-        self.HZ, self.HX = code.stabilizer_matrices()
+        self.backend = _check_backend(backend, TRACKZ_BACKENDS)
+        self.adaptive = adaptive
+        self.last_n_steps = None
+        self.last_scores = None
+        if self.backend in ('compiled', 'multispin', 'checkerboard', 'nfold') or adaptive:
+            self.support = code.support_table()
+        if self.backend == 'nfold':
+            self.neighbours = code.stabilizer_neighbour_table()
+        if self.backend == 'multispin':
+            # Random acceptance masks are drawn once and shared by all decodes
+            self.masks = mh_multispin.acceptance_masks(
+                np.log(self.q / (1.0 - self.q)), self.support.shape[1], 1 << 14,
+                np.random.default_rng(random.getrandbits(64)))
+        self._setup_initializers(code)
         
         # Precompute stabilizer vectors
         self.Zstab_vecs = [self.HZ[i] for i in range(self.HZ.shape[0])]
@@ -129,6 +324,8 @@ class MHDecoderTrackZ(Decoder):
         # Combined moves: X-stabs (act on eX) and Z-stabs (act on eZ)
         self.all_stabs = self.Xstab_vecs + self.Zstab_vecs
         self.n_X_stabs = len(self.Xstab_vecs)
+        if self.backend == 'checkerboard':
+            self.colour_classes = checkerboard_classes(code, self.n_X_stabs)
 
         # Precompute logical operators dynamically
         n = self.code.n
@@ -176,37 +373,165 @@ class MHDecoderTrackZ(Decoder):
     def decode(self, syndZ, syndX, init_method='MWPM'):
         # Initialize to trivial logical class
         if init_method == 'MWPM':
-            eX = utils.mwpm_initialize_e_given_syndrome(self.HZ, syndZ)
-            eZ = utils.mwpm_initialize_e_given_syndrome(self.HX, syndX)
+            eX = utils.mwpm_initialize_e_given_syndrome(self.HZ, syndZ, self.matching_Z)
+            eZ = utils.mwpm_initialize_e_given_syndrome(self.HX, syndX, self.matching_X)
         else:
-            eX = utils.ge_initialize_given_syndrome(self.HZ, syndZ)
-            eZ = utils.ge_initialize_given_syndrome(self.HX, syndX)
-            
-        best_eX, best_eZ, Z_ratios = metropolis_hastings_track_z(
-            eX, 
-            eZ, 
-            self.all_stabs, 
-            self.n_X_stabs, 
-            self.q, 
-            self.n_samples, 
-            self.burn_in, 
-            self.logicals_X, 
-            self.logicals_Z
-        )
+            eX = self.solver_Z.solve(syndZ)
+            eZ = self.solver_X.solve(syndX)
+
+        self.last_n_steps = self.n_samples
+        if self.adaptive:
+            best_eX, best_eZ, Z_ratios, self.last_n_steps = metropolis_hastings_adaptive_track_z(
+                eX, eZ, self.support, self.n_X_stabs, self.q, self.n_samples, self.burn_in,
+                self.logicals_X, self.logicals_Z, rng=random.getrandbits(64)
+            )
+        elif self.backend == 'multispin':
+            replicas = mh_multispin.REPLICAS
+            _, best_eXs, best_eZs, Z_ratios_r = mh_multispin.metropolis_hastings_multispin(
+                np.tile(eX, (replicas, 1)), np.tile(eZ, (replicas, 1)), self.support, self.n_X_stabs,
+                self.q, self.n_samples, self.burn_in, self.logicals_X, self.logicals_Z, masks=self.masks
+            )
+            Z_ratios = Z_ratios_r.mean(axis=0)
+            best_r = np.argmin((best_eXs | best_eZs).sum(axis=1))
+            best_eX, best_eZ = best_eXs[best_r], best_eZs[best_r]
+        elif self.backend == 'checkerboard':
+            best_eX, best_eZ, Z_ratios = metropolis_hastings_checkerboard_track_z(
+                eX, eZ, self.support, self.n_X_stabs, self.colour_classes, self.q,
+                _sweep_steps(self, self.n_samples), _sweep_steps(self, self.burn_in),
+                self.logicals_X, self.logicals_Z, rng=random.getrandbits(64)
+            )
+        elif self.backend == 'nfold':
+            best_eX, best_eZ, Z_ratios = mh_kernels.metropolis_hastings_nfold_track_z(
+                eX, eZ, self.support, self.neighbours, self.n_X_stabs, self.q, self.n_samples, self.burn_in,
+                self.logicals_X, self.logicals_Z
+            )
+        elif self.backend == 'compiled':
+            best_eX, best_eZ, Z_ratios = mh_kernels.metropolis_hastings_track_z(
+                eX, eZ, self.support, self.n_X_stabs, self.q, self.n_samples, self.burn_in,
+                self.logicals_X, self.logicals_Z
+            )
+        else:
+            best_eX, best_eZ, Z_ratios = metropolis_hastings_track_z(
+                eX, 
+                eZ, 
+                self.all_stabs, 
+                self.n_X_stabs, 
+                self.q, 
+                self.n_samples, 
+                self.burn_in, 
+                self.logicals_X, 
+                self.logicals_Z
+            )
         
+        self.last_scores = np.asarray(Z_ratios)
         best_class_idx = np.argmax(Z_ratios)
         
         lX_hat, lZ_hat = self.logicals_X[best_class_idx], self.logicals_Z[best_class_idx]
         
         return best_eX ^ lX_hat, best_eZ ^ lZ_hat
+
+    def decode_batch(self, syndZ_batch, syndX_batch, init_method='MWPM', return_scores=False, batch_size=256):
+        """
+        Decodes B syndromes at once: with the 'python' backend the B chains
+        advance in lockstep (MH_sampler.metropolis_hastings_lockstep_track_z),
+        batch_size shots at a time; other backends and adaptive mode decode
+        shot by shot with their own sampler. Returns (B, n) eX_hat, eZ_hat
+        and, with return_scores, the (B, num_classes) Z_ratios of every shot.
+        """
+        syndZ_batch = np.atleast_2d(syndZ_batch)
+        syndX_batch = np.atleast_2d(syndX_batch)
+        if self.backend != 'python' or self.adaptive:
+            # Scores must come from the configured sampler, and compiled
+            # per-shot chains already beat the NumPy lockstep
+            return _decode_each(self, syndZ_batch, syndX_batch, init_method, return_scores)
+        if not hasattr(self, 'support'):
+            self.support = self.code.support_table()
+        LX = np.array(self.logicals_X)
+        LZ = np.array(self.logicals_Z)
+
+        eX_hat, eZ_hat, scores = [], [], []
+        for start in range(0, syndZ_batch.shape[0], batch_size):
+            sZ = syndZ_batch[start:start + batch_size]
+            sX = syndX_batch[start:start + batch_size]
+            eX, eZ = _initialize_batch(self, sZ, sX, init_method)
+            best_eX, best_eZ, Z_ratios = metropolis_hastings_lockstep_track_z(
+                eX, eZ, self.support, self.n_X_stabs, self.q, self.n_samples, self.burn_in,
+                self.logicals_X, self.logicals_Z, rng=random.getrandbits(64)
+            )
+            best_class_idx = np.argmax(Z_ratios, axis=1)
+            eX_hat.append(best_eX ^ LX[best_class_idx])
+            eZ_hat.append(best_eZ ^ LZ[best_class_idx])
+            scores.append(Z_ratios)
+
+        eX_hat, eZ_hat = np.concatenate(eX_hat), np.concatenate(eZ_hat)
+        if return_scores:
+            return eX_hat, eZ_hat, np.concatenate(scores)
+        return eX_hat, eZ_hat
     
 class MHDecoderParallel(Decoder):
-    def __init__(self, code, q_error, n_samples=2000, burn_in=500):
+    def __init__(self, code, q_error, n_samples=2000, burn_in=500, backend='python', n_workers=None, betas=None, adaptive=False):
+        """
+        backend: 'python' runs the MH_sampler loops; 'compiled' runs the
+        mh_kernels versions (numba when installed) on a stabilizer support table;
+        'lockstep' advances all class chains together on (K, n) arrays;
+        'multispin' packs 64 // num_classes bit-sliced replicas per class
+        into one word (mh_multispin) and averages them per class;
+        'checkerboard' updates a whole colour class of non-overlapping
+        stabilizers per step, with n_samples and burn_in counted in
+        single-stabilizer proposals;
+        'tempering' runs a replica-exchange ladder at inverse temperatures
+        betas (default temperature_ladder()) per class, all in lockstep, and
+        compares the classes on their beta = 1 rungs; n_samples and burn_in
+        are split over the len(betas) rungs, so the total step count matches
+        the other backends. Per total step it is less accurate than 'lockstep'
+        on small codes (average-weight RMSE 0.23 vs 0.17 at toric L = 3,
+        q = 0.08; 0.45 vs 0.34 at planar L = 4, q = 0.1), where no weight
+        barrier needs crossing;
+        'racing' runs the class chains in lockstep rounds and drops classes
+        whose average weight is clearly worse than the leader's
+        (MH_sampler.metropolis_hastings_racing), so the total budget of
+        num_classes * n_samples steps goes to the close contenders;
+        'nfold' runs the rejection-free compiled sampler per class.
+        adaptive: run the class chains in lockstep until the lightest class is
+        settled (split R-hat, ESS and argmin stability), then as many steps
+        again for the averages (see
+        MH_sampler.metropolis_hastings_adaptive_avg_weight), with n_samples as
+        the cap; this replaces the backend's sampler. last_n_steps holds the
+        number of steps the last decode used and last_scores its per-class
+        average weights.
+        n_workers: None runs the logical-class chains one after another; an
+        int (or 0 for os.cpu_count()) runs them concurrently in a process
+        pool that is created on first use and reused across decode calls.
+        The pool runs the 'python', 'compiled', 'checkerboard' and 'nfold'
+        chains (POOL_BACKENDS); the other backends and adaptive mode
+        advance all classes together and raise ValueError if n_workers is set.
+        decode_batch sends every chain of a batch to the pool at once.
+        Call close() when done with a pooled decoder.
+        """
         self.code = code
         self.q = q_error
         self.n_samples = n_samples
         self.burn_in = burn_in
-        self.HZ, self.HX = code.stabilizer_matrices()
+        self.backend = _check_backend(backend, PARALLEL_BACKENDS)
+        if self.backend in ('compiled', 'lockstep', 'multispin', 'checkerboard', 'tempering', 'racing', 'nfold') or adaptive:
+            self.support = code.support_table()
+        if self.backend == 'nfold':
+            self.neighbours = code.stabilizer_neighbour_table()
+        self.adaptive = adaptive
+        self.last_n_steps = None
+        self.last_scores = None
+        self.betas = temperature_ladder() if betas is None else np.asarray(betas, dtype=float)
+        if self.backend == 'multispin':
+            # Random acceptance masks are drawn once and shared by all decodes
+            self.masks = mh_multispin.acceptance_masks(
+                np.log(self.q / (1.0 - self.q)), self.support.shape[1], 1 << 14,
+                np.random.default_rng(random.getrandbits(64)))
+        if n_workers is not None and (self.backend not in POOL_BACKENDS or adaptive):
+            raise ValueError(f"n_workers needs a non-adaptive backend in {POOL_BACKENDS}, got {self.backend!r}"
+                             + (" with adaptive=True" if adaptive else ""))
+        self.n_workers = (os.cpu_count() or 1) if n_workers == 0 else n_workers
+        self._pool = None
+        self._setup_initializers(code)
         
         # Precompute stabilizer vectors
         self.Zstab_vecs = [self.HZ[i] for i in range(self.HZ.shape[0])]
@@ -215,6 +540,8 @@ class MHDecoderParallel(Decoder):
         # Combined moves: X-stabs (act on eX) and Z-stabs (act on eZ)
         self.all_stabs = self.Xstab_vecs + self.Zstab_vecs
         self.n_X_stabs = len(self.Xstab_vecs)
+        if self.backend == 'checkerboard':
+            self.colour_classes = checkerboard_classes(code, self.n_X_stabs)
 
         # Precompute logical operators dynamically
         n = self.code.n
@@ -262,17 +589,46 @@ class MHDecoderParallel(Decoder):
     def decode(self, syndZ, syndX, init_method='MWPM'):
         # Initialize trivial class representative
         if init_method == 'MWPM':
-            eX_trivial = utils.mwpm_initialize_e_given_syndrome(self.HZ, syndZ)
-            eZ_trivial = utils.mwpm_initialize_e_given_syndrome(self.HX, syndX)
+            eX_trivial = utils.mwpm_initialize_e_given_syndrome(self.HZ, syndZ, self.matching_Z)
+            eZ_trivial = utils.mwpm_initialize_e_given_syndrome(self.HX, syndX, self.matching_X)
         else:
-            eX_trivial = utils.ge_initialize_given_syndrome(self.HZ, syndZ)
-            eZ_trivial = utils.ge_initialize_given_syndrome(self.HX, syndX)
+            eX_trivial = self.solver_Z.solve(syndZ)
+            eZ_trivial = self.solver_X.solve(syndX)
             
         min_avg_weight = np.inf
         overall_best_eX = eX_trivial.copy()
         overall_best_eZ = eZ_trivial.copy()
-        
-        # Run parallel chains for each logical class
+
+        self.last_n_steps = self.n_samples
+        if self.adaptive:
+            results = self._run_chains_adaptive(eX_trivial, eZ_trivial)
+        elif self.backend == 'lockstep':
+            results = self._run_chains_lockstep(eX_trivial, eZ_trivial)
+        elif self.backend == 'tempering':
+            results = self._run_chains_tempering(eX_trivial, eZ_trivial)
+        elif self.backend == 'racing':
+            results = self._run_chains_racing(eX_trivial, eZ_trivial)
+        elif self.backend == 'multispin':
+            results = self._run_chains_multispin(eX_trivial, eZ_trivial)
+        elif self.n_workers is None:
+            results = self._run_chains_serial(eX_trivial, eZ_trivial)
+        else:
+            results = self._run_chains_pool(
+                np.array([eX_trivial ^ lX_k for lX_k in self.logicals_X]),
+                np.array([eZ_trivial ^ lZ_k for lZ_k in self.logicals_Z]))
+
+        self.last_scores = np.array([res[0] for res in results], dtype=float)
+        for avg_weight_k, best_eX_k, best_eZ_k in results:
+            if avg_weight_k < min_avg_weight:
+                min_avg_weight = avg_weight_k
+                overall_best_eX = best_eX_k.copy()
+                overall_best_eZ = best_eZ_k.copy()
+                
+        return overall_best_eX, overall_best_eZ
+
+    def _run_chains_serial(self, eX_trivial, eZ_trivial):
+        # Run one chain for each logical class
+        results = []
         for k in range(len(self.logicals_X)):
             lX_k, lZ_k = self.logicals_X[k], self.logicals_Z[k]
             
@@ -280,25 +636,240 @@ class MHDecoderParallel(Decoder):
             init_eX = eX_trivial ^ lX_k
             init_eZ = eZ_trivial ^ lZ_k
             
-            avg_weight_k, best_eX_k, best_eZ_k = metropolis_hastings_avg_weight(
-                init_eX, init_eZ, self.all_stabs, self.n_X_stabs, self.q, self.n_samples, self.burn_in
+            if self.backend == 'compiled':
+                results.append(mh_kernels.metropolis_hastings_avg_weight(
+                    init_eX, init_eZ, self.support, self.n_X_stabs, self.q, self.n_samples, self.burn_in
+                ))
+            elif self.backend == 'nfold':
+                results.append(mh_kernels.metropolis_hastings_nfold_avg_weight(
+                    init_eX, init_eZ, self.support, self.neighbours, self.n_X_stabs, self.q,
+                    self.n_samples, self.burn_in
+                ))
+            elif self.backend == 'checkerboard':
+                results.append(metropolis_hastings_checkerboard_avg_weight(
+                    init_eX, init_eZ, self.support, self.n_X_stabs, self.colour_classes, self.q,
+                    _sweep_steps(self, self.n_samples), _sweep_steps(self, self.burn_in),
+                    rng=random.getrandbits(64)
+                ))
+            else:
+                results.append(metropolis_hastings_avg_weight(
+                    init_eX, init_eZ, self.all_stabs, self.n_X_stabs, self.q, self.n_samples, self.burn_in
+                ))
+        return results
+
+    def decode_batch(self, syndZ_batch, syndX_batch, init_method='MWPM', return_scores=False, batch_size=64):
+        """
+        Decodes B syndromes at once, batch_size shots at a time: with
+        n_workers the B * num_classes chains are all submitted to the pool;
+        otherwise the 'python' and 'lockstep' backends run them in lockstep,
+        and other backends and adaptive mode decode shot by shot with their
+        own sampler. Returns (B, n) eX_hat, eZ_hat and, with
+        return_scores, the (B, num_classes) average chain weights (lower is
+        better).
+        """
+        syndZ_batch = np.atleast_2d(syndZ_batch)
+        syndX_batch = np.atleast_2d(syndX_batch)
+        pooled = self.n_workers is not None
+        if not pooled and (self.backend not in ('python', 'lockstep') or self.adaptive):
+            # Scores must come from the configured sampler, and compiled
+            # per-shot chains already beat the NumPy lockstep
+            return _decode_each(self, syndZ_batch, syndX_batch, init_method, return_scores)
+        if not hasattr(self, 'support'):
+            self.support = self.code.support_table()
+        LX = np.array(self.logicals_X)
+        LZ = np.array(self.logicals_Z)
+        K = len(LX)
+
+        eX_hat, eZ_hat, scores = [], [], []
+        for start in range(0, syndZ_batch.shape[0], batch_size):
+            sZ = syndZ_batch[start:start + batch_size]
+            sX = syndX_batch[start:start + batch_size]
+            eX, eZ = _initialize_batch(self, sZ, sX, init_method)
+            B = eX.shape[0]
+            # Chain b * K + k starts shot b in logical class k
+            init_eX = (eX[:, None, :] ^ LX[None, :, :]).reshape(B * K, -1)
+            init_eZ = (eZ[:, None, :] ^ LZ[None, :, :]).reshape(B * K, -1)
+            if pooled:
+                avg_weights, best_eX, best_eZ = (np.array(col) for col in zip(*self._run_chains_pool(init_eX, init_eZ)))
+            else:
+                avg_weights, best_eX, best_eZ = metropolis_hastings_lockstep(
+                    init_eX, init_eZ, self.support, self.n_X_stabs, self.q, self.n_samples, self.burn_in,
+                    rng=random.getrandbits(64)
+                )
+            avg_weights = avg_weights.reshape(B, K)
+            chosen = np.arange(B) * K + np.argmin(avg_weights, axis=1)
+            eX_hat.append(best_eX[chosen])
+            eZ_hat.append(best_eZ[chosen])
+            scores.append(avg_weights)
+
+        eX_hat, eZ_hat = np.concatenate(eX_hat), np.concatenate(eZ_hat)
+        if return_scores:
+            return eX_hat, eZ_hat, np.concatenate(scores)
+        return eX_hat, eZ_hat
+
+    def _run_chains_lockstep(self, eX_trivial, eZ_trivial):
+        init_eX = np.array([eX_trivial ^ lX_k for lX_k in self.logicals_X])
+        init_eZ = np.array([eZ_trivial ^ lZ_k for lZ_k in self.logicals_Z])
+        avg_weights, best_eX, best_eZ = metropolis_hastings_lockstep(
+            init_eX, init_eZ, self.support, self.n_X_stabs, self.q, self.n_samples, self.burn_in,
+            rng=random.getrandbits(64)
+        )
+        return list(zip(avg_weights, best_eX, best_eZ))
+
+    def _run_chains_adaptive(self, eX_trivial, eZ_trivial):
+        init_eX = np.array([eX_trivial ^ lX_k for lX_k in self.logicals_X])
+        init_eZ = np.array([eZ_trivial ^ lZ_k for lZ_k in self.logicals_Z])
+        avg_weights, best_eX, best_eZ, self.last_n_steps = metropolis_hastings_adaptive_avg_weight(
+            init_eX, init_eZ, self.support, self.n_X_stabs, self.q, self.n_samples, self.burn_in,
+            rng=random.getrandbits(64)
+        )
+        return list(zip(avg_weights, best_eX, best_eZ))
+
+    def _run_chains_racing(self, eX_trivial, eZ_trivial):
+        init_eX = np.array([eX_trivial ^ lX_k for lX_k in self.logicals_X])
+        init_eZ = np.array([eZ_trivial ^ lZ_k for lZ_k in self.logicals_Z])
+        avg_weights, best_eX, best_eZ, alive, n_steps = metropolis_hastings_racing(
+            init_eX, init_eZ, self.support, self.n_X_stabs, self.q, self.n_samples, self.burn_in,
+            rng=random.getrandbits(64)
+        )
+        # Mean steps per class; eliminated classes cannot win
+        self.last_n_steps = n_steps.mean()
+        return list(zip(np.where(alive, avg_weights, np.inf), best_eX, best_eZ))
+
+    def _run_chains_tempering(self, eX_trivial, eZ_trivial):
+        init_eX = np.array([eX_trivial ^ lX_k for lX_k in self.logicals_X])
+        init_eZ = np.array([eZ_trivial ^ lZ_k for lZ_k in self.logicals_Z])
+        # n_samples and burn_in are shared by the whole ladder, so a class
+        # costs the same number of single-stabilizer steps as on other backends
+        R = len(self.betas)
+        n_samples, burn_in = max(1, self.n_samples // R), self.burn_in // R
+        avg_weights, best_eX, best_eZ = metropolis_hastings_tempering_avg_weight(
+            init_eX, init_eZ, self.support, self.n_X_stabs, self.q, n_samples, burn_in,
+            betas=self.betas, rng=random.getrandbits(64)
+        )
+        self.last_n_steps = n_samples * R
+        return list(zip(avg_weights, best_eX, best_eZ))
+
+    def _run_chains_multispin(self, eX_trivial, eZ_trivial):
+        K = len(self.logicals_X)
+        per_class = max(1, mh_multispin.REPLICAS // K)
+        # Replica k * per_class + r runs in logical class k
+        init_eX = np.repeat(np.array([eX_trivial ^ lX_k for lX_k in self.logicals_X]), per_class, axis=0)
+        init_eZ = np.repeat(np.array([eZ_trivial ^ lZ_k for lZ_k in self.logicals_Z]), per_class, axis=0)
+        results = []
+        for start in range(0, K * per_class, mh_multispin.REPLICAS):
+            avg, best_eX, best_eZ, _ = mh_multispin.metropolis_hastings_multispin(
+                init_eX[start:start + mh_multispin.REPLICAS], init_eZ[start:start + mh_multispin.REPLICAS],
+                self.support, self.n_X_stabs, self.q, self.n_samples, self.burn_in, masks=self.masks
             )
-            
-            if avg_weight_k < min_avg_weight:
-                min_avg_weight = avg_weight_k
-                overall_best_eX = best_eX_k.copy()
-                overall_best_eZ = best_eZ_k.copy()
-                
-        return overall_best_eX, overall_best_eZ
+            results.extend(zip(avg, best_eX, best_eZ))
+        merged = []
+        for k in range(K):
+            chunk = results[k * per_class:(k + 1) * per_class]
+            best = min(chunk, key=lambda res: np.sum(res[1] | res[2]))
+            merged.append((np.mean([res[0] for res in chunk]), best[1], best[2]))
+        return merged
+
+    def _run_chains_pool(self, init_eX, init_eZ):
+        # One pool task per row of init_eX / init_eZ
+        n_samples, burn_in = self.n_samples, self.burn_in
+        if self.backend == 'compiled':
+            stabs = self.support
+        elif self.backend == 'nfold':
+            stabs = (self.support, self.neighbours)
+        elif self.backend == 'checkerboard':
+            stabs = (self.support, self.colour_classes)
+            n_samples, burn_in = _sweep_steps(self, n_samples), _sweep_steps(self, burn_in)
+        else:
+            stabs = self.all_stabs
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.n_workers,
+                initializer=_init_chain_worker,
+                initargs=(self.backend, stabs, self.n_X_stabs),
+            )
+        # Independent RNG stream per chain, derived from the random module's state
+        seeds = np.random.SeedSequence(random.getrandbits(64)).generate_state(len(init_eX))
+        futures = [
+            self._pool.submit(_run_chain_worker, eX, eZ, self.q, n_samples, burn_in, int(seed))
+            for eX, eZ, seed in zip(init_eX, init_eZ, seeds)
+        ]
+        return [f.result() for f in futures]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Per-process state for MHDecoderParallel's worker pool
+_CHAIN_WORKER = {}
+
+def _init_chain_worker(backend, stabs, n_X_stabs):
+    _CHAIN_WORKER['backend'] = backend
+    _CHAIN_WORKER['stabs'] = stabs
+    _CHAIN_WORKER['n_X_stabs'] = n_X_stabs
+
+def _run_chain_worker(init_eX, init_eZ, q, n_samples, burn_in, seed):
+    w = _CHAIN_WORKER
+    if w['backend'] == 'compiled':
+        return mh_kernels.metropolis_hastings_avg_weight(
+            init_eX, init_eZ, w['stabs'], w['n_X_stabs'], q, n_samples, burn_in, seed=seed
+        )
+    if w['backend'] == 'nfold':
+        support, neighbours = w['stabs']
+        return mh_kernels.metropolis_hastings_nfold_avg_weight(
+            init_eX, init_eZ, support, neighbours, w['n_X_stabs'], q, n_samples, burn_in, seed=seed
+        )
+    if w['backend'] == 'checkerboard':
+        support, colour_classes = w['stabs']
+        return metropolis_hastings_checkerboard_avg_weight(
+            init_eX, init_eZ, support, w['n_X_stabs'], colour_classes, q, n_samples, burn_in, rng=seed
+        )
+    if w['backend'] != 'python':
+        raise ValueError(f"Backend {w['backend']} cannot run in the chain pool")
+    random.seed(seed)
+    return metropolis_hastings_avg_weight(init_eX, init_eZ, w['stabs'], w['n_X_stabs'], q, n_samples, burn_in)
+
+def _decode_each(decoder, syndZ_batch, syndX_batch, init_method, return_scores=False):
+    out, scores = [], []
+    for sZ, sX in zip(syndZ_batch, syndX_batch):
+        out.append(decoder.decode(sZ, sX, init_method=init_method))
+        scores.append(decoder.last_scores)
+    eX_hat, eZ_hat = np.array([o[0] for o in out]), np.array([o[1] for o in out])
+    if return_scores:
+        return eX_hat, eZ_hat, np.array(scores)
+    return eX_hat, eZ_hat
+
+def _initialize_batch(decoder, syndZ_batch, syndX_batch, init_method):
+    # Batched MWPM / GE initialization shared by the MH decode_batch methods
+    if init_method == 'MWPM':
+        eX = utils.mwpm_decode_batch(decoder.HZ, syndZ_batch, decoder.matching_Z)
+        eZ = utils.mwpm_decode_batch(decoder.HX, syndX_batch, decoder.matching_X)
+    else:
+        eX = decoder.solver_Z.solve_batch(syndZ_batch)
+        eZ = decoder.solver_X.solve_batch(syndX_batch)
+    return eX.astype(int), eZ.astype(int)
 
 class GEDecoder(Decoder):
     def __init__(self, code):
         self.code = code
         self.HZ, self.HX = code.stabilizer_matrices()
+        self.solver_Z, self.solver_X = code.gf2_solvers()
 
     def decode(self, syndZ, syndX):
-        eX_hat = utils.ge_initialize_given_syndrome(self.HZ, syndZ)
-        eZ_hat = utils.ge_initialize_given_syndrome(self.HX, syndX)
+        eX_hat = self.solver_Z.solve(syndZ)
+        eZ_hat = self.solver_X.solve(syndX)
+        return eX_hat, eZ_hat
+
+    def decode_batch(self, syndZ_batch, syndX_batch):
+        eX_hat = self.solver_Z.solve_batch(syndZ_batch)
+        eZ_hat = self.solver_X.solve_batch(syndX_batch)
         return eX_hat, eZ_hat
 
 class BPDecoder(Decoder):
@@ -327,4 +898,41 @@ class BPDecoder(Decoder):
     def decode(self, syndZ, syndX):
         eX_hat = self.bp_decoder_X.decode(syndZ)
         eZ_hat = self.bp_decoder_Z.decode(syndX)
-        return eX_hat, eZ_hat
\ No newline at end of file
+        return eX_hat, eZ_hat
+
+class MLDecoder(Decoder):
+    def __init__(self, code, p, chi=None):
+        """
+        Maximum-likelihood (coset) decoder: the probability of every logical
+        class is the partition function of a tensor network over the
+        stabilizer group (tensor_network), contracted with a boundary MPS of
+        bond dimension chi (Bravyi-Suchara-Vargo).
+
+        p: physical depolarizing error rate.
+        chi: None picks tensor_network.default_chi(code): 16 for planar codes,
+        where that is converged, and 256 for toric codes, whose boundary also
+        carries the wrap-around legs (exact up to L = 4; about 5 s per coset
+        at L = 5). Smaller toric chi is faster but only approximately ML, and
+        toric codes beyond L ~ 8 are out of reach (see tensor_network).
+        """
+        self.code = code
+        self.p = float(p)
+        self.chi = tensor_network.default_chi(code) if chi is None else chi
+        self.HZ, self.HX = code.stabilizer_matrices()
+        self.solver_Z, self.solver_X = code.gf2_solvers()
+
+    def coset_log_probs(self, eX, eZ):
+        """
+        log probabilities of the logical classes of (eX, eZ), in the order of
+        utils.generate_all_sectors, with the sector representatives.
+        """
+        sectors = utils.generate_all_sectors(eX, eZ, self.code)
+        log_probs = np.array([tensor_network.coset_log_probability(self.code, sX, sZ, self.p, self.chi)
+                              for sX, sZ in sectors])
+        return log_probs, sectors
+
+    def decode(self, syndZ, syndX):
+        eX = self.solver_Z.solve(syndZ)
+        eZ = self.solver_X.solve(syndX)
+        log_probs, sectors = self.coset_log_probs(eX, eZ)
+        return sectors[int(np.argmax(log_probs))]
\ No newline at end of file
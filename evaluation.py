@@ -1,15 +1,17 @@
-from utils import coset_weight_distr, generate_all_sectors, ge_initialize_given_syndrome
+from utils import sector_weight_enums, weight_distr
 import numpy as np
 from itertools import product
 import matplotlib.pyplot as plt
-from MH_sampler import metropolis_hastings_coset_probs
-from noise import depolarizing_noise
+from MH_sampler import metropolis_hastings_coset_probs, metropolis_hastings_coset_estimators
+from mh_kernels import code_support_table
+from noise import depolarizing_noise_batch
 import syndrome as synd
 
 def coset_probs_exact(eX, eZ, code, p):
     """Calculates exact probabilities and returns (probs, labels)."""
-    all_sectors = generate_all_sectors(eX, eZ, code)
-    num_logical_qubits = int(np.round(np.log2(len(all_sectors)) / 2))
+    # One pass over the stabilizer group gives every sector's enumerator
+    A = sector_weight_enums(eX, eZ, code)
+    num_logical_qubits = int(np.round(np.log2(len(A)) / 2))
     
     labels = []
     for c_bits in product([0, 1], repeat=num_logical_qubits):
@@ -21,15 +23,18 @@ def coset_probs_exact(eX, eZ, code, p):
                 pauli_str += mapping[(b, c)]
             labels.append(pauli_str)
             
-    P = []
-    for lX, lZ in all_sectors:
-        P.append(coset_weight_distr(lX, lZ, code, p))
+    P = list(weight_distr(A, code.n, p))
     return P, labels
 
-def coset_probs_mcmc(eX, eZ, code, p, n_samples=20000, burn_in=5000):
+def coset_probs_mcmc(eX, eZ, code, p, n_samples=20000, burn_in=5000, estimator='naive'):
     """
     Estimates the probability of all logical cosets using MCMC tracking.
-    Returns (coset_probs, min_weight_error_probs).
+    estimator: 'naive' averages exp(dw * log_odds) along each chain
+    (metropolis_hastings_coset_probs); 'bar' and 'rb' use the Bennett
+    acceptance ratio and Rao-Blackwellized estimators of
+    metropolis_hastings_coset_estimators, whose errors are of the same
+    order as 'naive' (see its docstring).
+    Returns (coset_probs, min_weight_error_probs, labels).
     """
     # 1. Setup sampler parameters
     q = p / (3 - 2 * p) # Conversion for depolarizing noise
@@ -72,10 +77,19 @@ def coset_probs_mcmc(eX, eZ, code, p, n_samples=20000, burn_in=5000):
             labels.append(pauli_str)
 
     # 3. Run the sampler (using independent parallel chains for each class)
-    Z_ratios, min_weights = metropolis_hastings_coset_probs(
-        np.array(eX, dtype=int), np.array(eZ, dtype=int), all_stabs, n_X_stabs, 
-        q, int(n_samples), int(burn_in), logicals_X, logicals_Z
-    )
+    if estimator == 'naive':
+        Z_ratios, min_weights = metropolis_hastings_coset_probs(
+            np.array(eX, dtype=int), np.array(eZ, dtype=int), all_stabs, n_X_stabs, 
+            q, int(n_samples), int(burn_in), logicals_X, logicals_Z
+        )
+    elif estimator in ('bar', 'rb'):
+        estimates = metropolis_hastings_coset_estimators(
+            np.array(eX, dtype=int), np.array(eZ, dtype=int), code_support_table(code), n_X_stabs,
+            q, int(n_samples), int(burn_in), logicals_X, logicals_Z
+        )
+        Z_ratios, min_weights = estimates[estimator], estimates['min_weights']
+    else:
+        raise ValueError(f"Unknown estimator: {estimator}")
 
     # 4. Calculate individual probabilities for the minimum weight errors found
     p_min_weights = [(p/3)**w * (1-p)**(n-w) for w in min_weights]
@@ -122,7 +136,7 @@ def get_all_syndromes(code):
     return [(sz, sx) for sz in syndZs for sx in syndXs]
 
 def syndrome_probs(code, p):  
-    HZ, HX = code.stabilizer_matrices()
+    solver_Z, solver_X = code.gf2_solvers()
     all_syndromes = get_all_syndromes(code)
     
     probs_dict = {}
@@ -130,8 +144,8 @@ def syndrome_probs(code, p):
     
     for sz, sx in all_syndromes:
         # Find representative error vectors for the given syndrome bitstrings
-        eX = ge_initialize_given_syndrome(HZ, sz)
-        eZ = ge_initialize_given_syndrome(HX, sx)
+        eX = solver_Z.solve(sz)
+        eZ = solver_X.solve(sx)
         
         # Sum probabilities across all logical cosets to get total syndrome probability
         probs, _ = coset_probs_exact(eX, eZ, code, p)
@@ -149,19 +163,20 @@ def syndrome_probs(code, p):
             
     return probs_dict
 
-def bar_graph_syndrome_avg(code, p, n_synd_samples=1000):
-    HZ, HX = code.stabilizer_matrices()
+def bar_graph_syndrome_avg(code, p, n_synd_samples=1000, rng=None):
+    solver_Z, solver_X = code.gf2_solvers()
     #probs_dict = syndrome_probs(code, p)
     n = code.n
+    ex, ez = depolarizing_noise_batch(n, p, n_synd_samples, rng)
+    sZ = synd.syndrome_batch_from_eX(ex, code)
+    sX = synd.syndrome_batch_from_eZ(ez, code)
+    mZ = sZ.shape[1]
+    # Count distinct (sZ, sX) rows in one pass
+    rows, counts = np.unique(np.concatenate([sZ, sX], axis=1), axis=0, return_counts=True)
     syndrome_counts = {}
-    for _ in range(n_synd_samples):
-        ex, ez = depolarizing_noise(n, p)
-        sZ = synd.syndrome_from_eX(ex, code.Z_stabilizers)
-        sX = synd.syndrome_from_eZ(ez, code.X_stabilizers)
-        key = (tuple(sZ), tuple(sX))
-        if key not in syndrome_counts:
-            syndrome_counts[key] = 0
-        syndrome_counts[key] += 1
+    for row, count in zip(rows, counts):
+        key = (tuple(row[:mZ].tolist()), tuple(row[mZ:].tolist()))
+        syndrome_counts[key] = int(count)
     
     avg_probs = None
     avg_mcmc_probs = None
@@ -186,8 +201,8 @@ def bar_graph_syndrome_avg(code, p, n_synd_samples=1000):
         sx = np.array(sx_tuple)
 
         # Use a valid representative error for this syndrome
-        eX = ge_initialize_given_syndrome(HZ, sz)
-        eZ = ge_initialize_given_syndrome(HX, sx)
+        eX = solver_Z.solve(sz)
+        eZ = solver_X.solve(sx)
         
         # Get exact coset probabilities: P(L_i and S)
         probs, current_labels = coset_probs_exact(eX, eZ, code, p)
@@ -0,0 +1,114 @@
+import numpy as np
+
+WORD = 64
+
+def n_words(n):
+    return (n + WORD - 1) // WORD
+
+def pack_rows(A):
+    """
+    Packs a (m, n) 0/1 array into (m, n_words(n)) uint64 words.
+    Column j is bit j % 64 of word j // 64.
+    """
+    A = np.atleast_2d(np.asarray(A, dtype=np.uint8) & 1)
+    m, n = A.shape
+    padded = np.zeros((m, n_words(n) * WORD), dtype=np.uint8)
+    padded[:, :n] = A
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8').astype(np.uint64)
+
+def unpack_rows(P, n):
+    """Inverse of pack_rows: (m, words) uint64 -> (m, n) uint8."""
+    P = np.ascontiguousarray(np.atleast_2d(P), dtype='<u8')
+    bits = np.unpackbits(P.view(np.uint8), axis=1, bitorder='little')
+    return bits[:, :n]
+
+def _get_bit(P, c):
+    return ((P[:, c // WORD] >> np.uint64(c % WORD)) & np.uint64(1)).astype(bool)
+
+class GF2Solver:
+    def __init__(self, H):
+        """
+        Factors a parity-check matrix once so that particular solutions of
+        H x = s over GF(2) cost one packed matrix-vector product.
+
+        Row reduction runs on the packed augmented matrix [H | I]. The pivot
+        rows of the transform give a right-inverse G (n x m) restricted to the
+        column space of H, so x = G s puts s' = T s on the pivot columns and
+        zero on the free ones, exactly as ge_initialize_given_syndrome does.
+
+        Args:
+            H: (m, n) parity-check matrix (dense or scipy sparse).
+        """
+        if hasattr(H, 'toarray'):
+            H = H.toarray()
+        H = np.asarray(H) % 2
+        m, n = H.shape
+        self.m, self.n = m, n
+
+        A = pack_rows(np.concatenate([H, np.eye(m, dtype=np.uint8)], axis=1))
+        r = 0
+        pivots = []
+        for c in range(n):
+            col = _get_bit(A, c)
+            below = np.flatnonzero(col[r:])
+            if len(below) == 0:
+                continue
+            i = r + below[0]
+            if i != r:
+                A[[r, i]] = A[[i, r]]
+                col[[r, i]] = col[[i, r]]
+            col[r] = False
+            A[col] ^= A[r]
+            pivots.append(c)
+            r += 1
+            if r == m:
+                break
+
+        self.rank = r
+        self.pivots = np.array(pivots, dtype=np.int64)
+        # Rows of T for the pivot rows: s' = T s
+        T = unpack_rows(A[:r], n + m)[:, n:]
+        # G^T (m x n): syndrome bit k contributes T[:, k] on the pivot columns
+        Gt = np.zeros((m, n), dtype=np.uint8)
+        Gt[:, self.pivots] = T.T
+        self.Gt_packed = pack_rows(Gt)
+        self._tables = None
+
+    def _byte_tables(self):
+        # Four-Russians tables: for each group of 8 syndrome bits, the XOR of
+        # every subset of the corresponding 8 rows of G^T
+        if self._tables is None:
+            m = self.m
+            groups = (m + 7) // 8
+            words = self.Gt_packed.shape[1]
+            rows = np.zeros((groups * 8, words), dtype=np.uint64)
+            rows[:m] = self.Gt_packed
+            rows = rows.reshape(groups, 8, words)
+            tables = np.zeros((groups, 256, words), dtype=np.uint64)
+            for bit in range(8):
+                lo = 1 << bit
+                tables[:, lo:2 * lo] = tables[:, :lo] ^ rows[:, bit][:, None, :]
+            self._tables = tables
+        return self._tables
+
+    def solve_packed(self, S):
+        """(B, m) syndromes -> (B, words) packed particular solutions."""
+        S = np.atleast_2d(np.asarray(S, dtype=np.uint8))
+        tables = self._byte_tables()
+        groups = tables.shape[0]
+        padded = np.zeros((S.shape[0], groups * 8), dtype=np.uint8)
+        padded[:, :self.m] = S & 1
+        byte_idx = np.packbits(padded, axis=1, bitorder='little')
+        X = np.zeros((S.shape[0], tables.shape[2]), dtype=np.uint64)
+        for g in range(groups):
+            X ^= tables[g, byte_idx[:, g]]
+        return X
+
+    def solve_batch(self, S):
+        """(B, m) syndromes -> (B, n) particular solutions."""
+        return unpack_rows(self.solve_packed(S), self.n).astype(int)
+
+    def solve(self, s):
+        """Single syndrome -> length-n particular solution."""
+        return self.solve_batch(np.asarray(s).reshape(1, -1))[0]
+
@@ -1,7 +1,7 @@
 from code import ToricCode, PlanarSurfaceCode
 from noise import depolarizing_noise
 from syndrome import syndrome_from_eX, syndrome_from_eZ
-from decoder import MWPMDecoder, MHDecoder, GEDecoder, MHDecoderSingleChain, MHDecoderTrackZ, MHDecoderParallel
+from decoder import MWPMDecoder, MHDecoder, GEDecoder, MHDecoderSingleChain, MHDecoderTrackZ, MHDecoderParallel, MLDecoder
 from logical import logical_parity
 import numpy as np
 import matplotlib.pyplot as plt
@@ -39,6 +39,8 @@ def run_single_experiment(L=5, p=0.05, decoder_type="MWPM", init_method='MWPM',
         decoder = MHDecoderParallel(code, q_error=p/(3-2*p))
     elif decoder_type == "GE":
         decoder = GEDecoder(code)
+    elif decoder_type == "ML":
+        decoder = MLDecoder(code, p)
     else:
         raise ValueError(f"Unknown decoder_type: {decoder_type}")
 
@@ -0,0 +1,460 @@
+import numpy as np
+import random
+try:
+    import numba
+    _HAVE_NUMBA = not numba.config.DISABLE_JIT
+except Exception:
+    _HAVE_NUMBA = False
+
+if _HAVE_NUMBA:
+    # Compiled kernels draw from numba's own generator, separate from NumPy's global one
+    uniform = np.random.random
+    randint = np.random.randint
+else:
+    # The plain-Python fallback draws from a private RandomState so seeding a
+    # run never touches NumPy's global state
+    _fallback_state = np.random.RandomState()
+    uniform = _fallback_state.random_sample
+    randint = _fallback_state.randint
+
+def njit(fn):
+    """Compiles fn with numba when available; otherwise returns it to run as plain Python."""
+    if _HAVE_NUMBA:
+        return numba.njit(cache=True)(fn)
+    return fn
+
+def support_table(stabilizers):
+    """
+    Fixed-width (m_stab, max_weight) int32 table of stabilizer supports,
+    padded with -1 (boundary stabilizers of the planar code have weight 3).
+    """
+    width = max(len(s) for s in stabilizers)
+    table = np.full((len(stabilizers), width), -1, dtype=np.int32)
+    for j, stab in enumerate(stabilizers):
+        table[j, :len(stab)] = stab
+    return table
+
+def code_support_table(code):
+    """Support table ordered like all_stabs in the MH decoders: X-stabs, then Z-stabs (cached on the code)."""
+    return code.support_table()
+
+def neighbour_table(support, n):
+    """
+    (m_stab, max_neighbours) table, padded with -1, of the stabilizers that
+    share a qubit with each stabilizer of a support table (itself included):
+    the moves whose weight change a flip of that stabilizer can alter.
+    """
+    stabs_on = [[] for _ in range(n)]
+    for j, row in enumerate(support):
+        for q in row[row >= 0]:
+            stabs_on[q].append(j)
+    return support_table([sorted({k for q in row[row >= 0] for k in stabs_on[q]}) for row in support])
+
+def acceptance_table(log_odds, max_weight):
+    """min(1, exp(delta * log_odds)) for delta in [-max_weight, max_weight], indexed by delta + max_weight."""
+    deltas = np.arange(-max_weight, max_weight + 1)
+    return np.minimum(1.0, np.exp(deltas * log_odds))
+
+def error_log_odds(q_error):
+    """ln(q / (1 - q)), the log acceptance ratio per unit of weight added."""
+    if q_error == 0 or q_error == 1:
+        raise ValueError("q_error cannot be 0 or 1")
+    return np.log(q_error / (1.0 - q_error))
+
+def seed_value(seed):
+    """int(seed), or a seed drawn from the random module when None so random.seed() still controls the run."""
+    return random.randrange(2**31) if seed is None else int(seed)
+
+@njit
+def _seed_compiled(seed):
+    np.random.seed(seed)
+
+def seed_kernels(seed):
+    """Seeds the generator behind uniform() and randint() in the kernels."""
+    if _HAVE_NUMBA:
+        _seed_compiled(seed)
+    else:
+        _fallback_state.seed(seed)
+
+@njit
+def _delta_weight(eX, eZ, support, j, is_X):
+    d = 0
+    for t in range(support.shape[1]):
+        q = support[j, t]
+        if q < 0:
+            break
+        old = eX[q] | eZ[q]
+        if is_X:
+            new = (eX[q] ^ 1) | eZ[q]
+        else:
+            new = eX[q] | (eZ[q] ^ 1)
+        d += new - old
+    return d
+
+@njit
+def _flip(eX, eZ, support, j, is_X):
+    for t in range(support.shape[1]):
+        q = support[j, t]
+        if q < 0:
+            break
+        if is_X:
+            eX[q] ^= 1
+        else:
+            eZ[q] ^= 1
+
+@njit
+def _mh_step(eX, eZ, support, n_X_stabs, accept):
+    # One single-stabilizer proposal; returns the accepted weight change (0 if rejected)
+    max_w = support.shape[1]
+    j = randint(0, support.shape[0])
+    is_X = j < n_X_stabs
+    d = _delta_weight(eX, eZ, support, j, is_X)
+    a = accept[d + max_w]
+    if a >= 1.0 or uniform() < a:
+        _flip(eX, eZ, support, j, is_X)
+        return d, True
+    return 0, False
+
+@njit
+def _weight(eX, eZ):
+    w = 0
+    for q in range(eX.shape[0]):
+        w += eX[q] | eZ[q]
+    return w
+
+@njit
+def _sector_weight(eX, eZ, lX, lZ):
+    w = 0
+    for q in range(eX.shape[0]):
+        w += (eX[q] ^ lX[q]) | (eZ[q] ^ lZ[q])
+    return w
+
+@njit
+def _sector_offsets(eX, eZ, w, LX, LZ):
+    D = np.empty(LX.shape[0], dtype=np.int64)
+    for k in range(LX.shape[0]):
+        D[k] = _sector_weight(eX, eZ, LX[k], LZ[k]) - w
+    return D
+
+@njit
+def _touches_table(support, LX, LZ):
+    # touches[j]: stabilizer j overlaps the support of some logical shift
+    on = np.zeros(LX.shape[1], dtype=np.bool_)
+    for k in range(LX.shape[0]):
+        for q in range(LX.shape[1]):
+            if LX[k, q] | LZ[k, q]:
+                on[q] = True
+    touches = np.zeros(support.shape[0], dtype=np.bool_)
+    for j in range(support.shape[0]):
+        for t in range(support.shape[1]):
+            q = support[j, t]
+            if q < 0:
+                break
+            if on[q]:
+                touches[j] = True
+                break
+    return touches
+
+@njit
+def _update_sector_offsets(eX, eZ, support, j, is_X, LX, LZ, D, ratios, log_odds):
+    # Called after stabilizer j was flipped: D[k] = w_k - w changes only on its support
+    for k in range(LX.shape[0]):
+        dk = 0
+        for t in range(support.shape[1]):
+            q = support[j, t]
+            if q < 0:
+                break
+            x, z = eX[q], eZ[q]
+            ox = x ^ 1 if is_X else x
+            oz = z if is_X else z ^ 1
+            lx, lz = LX[k, q], LZ[k, q]
+            dk += (((x ^ lx) | (z ^ lz)) - ((ox ^ lx) | (oz ^ lz))) - ((x | z) - (ox | oz))
+        if dk != 0:
+            D[k] += dk
+            ratios[k] = np.exp(D[k] * log_odds)
+
+@njit
+def _joint_kernel(eX, eZ, support, n_X_stabs, accept, log_odds, n_samples):
+    w = _weight(eX, eZ)
+    best_logp = w * log_odds
+    best_eX = eX.copy()
+    best_eZ = eZ.copy()
+    for _ in range(n_samples):
+        d, moved = _mh_step(eX, eZ, support, n_X_stabs, accept)
+        w += d
+        if moved and w * log_odds > best_logp:
+            best_logp = w * log_odds
+            best_eX[:] = eX
+            best_eZ[:] = eZ
+    return best_eX, best_eZ, best_logp
+
+@njit
+def _avg_weight_kernel(eX, eZ, support, n_X_stabs, accept, log_odds, n_samples, burn_in):
+    w = _weight(eX, eZ)
+    best_logp = w * log_odds
+    best_eX = eX.copy()
+    best_eZ = eZ.copy()
+    total_weight = 0
+    n_post = 0
+    for i in range(n_samples):
+        d, moved = _mh_step(eX, eZ, support, n_X_stabs, accept)
+        w += d
+        if moved and w * log_odds > best_logp:
+            best_logp = w * log_odds
+            best_eX[:] = eX
+            best_eZ[:] = eZ
+        if i >= burn_in:
+            total_weight += w
+            n_post += 1
+    avg_weight = total_weight / n_post if n_post > 0 else float(w)
+    return avg_weight, best_eX, best_eZ
+
+@njit
+def _track_z_kernel(eX, eZ, support, n_X_stabs, accept, log_odds, n_samples, burn_in, LX, LZ):
+    w = _weight(eX, eZ)
+    best_logp = w * log_odds
+    best_eX = eX.copy()
+    best_eZ = eZ.copy()
+    K = LX.shape[0]
+    Z_ratios = np.zeros(K)
+    n_post = 0
+    touches = _touches_table(support, LX, LZ)
+    D = _sector_offsets(eX, eZ, w, LX, LZ)
+    ratios = np.exp(D * log_odds)
+    for i in range(n_samples):
+        j = randint(0, support.shape[0])
+        is_X = j < n_X_stabs
+        d = _delta_weight(eX, eZ, support, j, is_X)
+        a = accept[d + support.shape[1]]
+        if a >= 1.0 or uniform() < a:
+            _flip(eX, eZ, support, j, is_X)
+            w += d
+            if touches[j]:
+                _update_sector_offsets(eX, eZ, support, j, is_X, LX, LZ, D, ratios, log_odds)
+            if w * log_odds > best_logp:
+                best_logp = w * log_odds
+                best_eX[:] = eX
+                best_eZ[:] = eZ
+        if i >= burn_in:
+            n_post += 1
+            Z_ratios += ratios
+    if n_post > 0:
+        Z_ratios /= n_post
+    return best_eX, best_eZ, Z_ratios
+
+@njit
+def _coset_probs_kernel(eX_init, eZ_init, support, n_X_stabs, accept, log_odds, n_samples, burn_in, LX, LZ):
+    K = LX.shape[0]
+    aggregated_probs = np.zeros(K)
+    min_weights = np.full(K, np.inf)
+    for s in range(K):
+        eX = eX_init ^ LX[s]
+        eZ = eZ_init ^ LZ[s]
+        w = _weight(eX, eZ)
+        chain_Z_ratios = np.zeros(K)
+        n_post = 0
+        # Relative shifts from sector s to every sector k, tracked incrementally
+        RX = LX ^ LX[s]
+        RZ = LZ ^ LZ[s]
+        touches = _touches_table(support, RX, RZ)
+        D = _sector_offsets(eX, eZ, w, RX, RZ)
+        ratios = np.exp(D * log_odds)
+        for i in range(n_samples):
+            j = randint(0, support.shape[0])
+            is_X = j < n_X_stabs
+            d = _delta_weight(eX, eZ, support, j, is_X)
+            a = accept[d + support.shape[1]]
+            if a >= 1.0 or uniform() < a:
+                _flip(eX, eZ, support, j, is_X)
+                w += d
+                if touches[j]:
+                    _update_sector_offsets(eX, eZ, support, j, is_X, RX, RZ, D, ratios, log_odds)
+            if i >= burn_in:
+                n_post += 1
+                for k in range(K):
+                    if D[k] + w < min_weights[k]:
+                        min_weights[k] = D[k] + w
+                chain_Z_ratios += ratios
+        if n_post > 0:
+            chain_dist = chain_Z_ratios / n_post
+            total = chain_dist.sum()
+            if total > 0:
+                aggregated_probs += chain_dist / total
+    return aggregated_probs, min_weights
+
+@njit
+def _bin_move(members, count, pos, cur_bin, j, b):
+    # Moves stabilizer j from its current delta bin to bin b (swap-remove, append)
+    old = cur_bin[j]
+    last = members[old, count[old] - 1]
+    members[old, pos[j]] = last
+    pos[last] = pos[j]
+    count[old] -= 1
+    members[b, count[b]] = j
+    pos[j] = count[b]
+    count[b] += 1
+    cur_bin[j] = b
+
+@njit
+def _nfold_kernel(eX, eZ, support, neighbours, n_X_stabs, accept, log_odds, n_samples, burn_in, LX, LZ, track):
+    m = support.shape[0]
+    max_w = support.shape[1]
+    n_bins = 2 * max_w + 1
+
+    # Stabilizers binned by the weight change of flipping them; every move in
+    # bin b has acceptance probability accept[b]
+    members = np.empty((n_bins, m), dtype=np.int64)
+    count = np.zeros(n_bins, dtype=np.int64)
+    pos = np.empty(m, dtype=np.int64)
+    cur_bin = np.empty(m, dtype=np.int64)
+    for j in range(m):
+        b = _delta_weight(eX, eZ, support, j, j < n_X_stabs) + max_w
+        members[b, count[b]] = j
+        pos[j] = count[b]
+        count[b] += 1
+        cur_bin[j] = b
+
+    w = _weight(eX, eZ)
+    best_logp = w * log_odds
+    best_eX = eX.copy()
+    best_eZ = eZ.copy()
+
+    K = LX.shape[0]
+    Z_ratios = np.zeros(K)
+    if track:
+        touches = _touches_table(support, LX, LZ)
+        D = _sector_offsets(eX, eZ, w, LX, LZ)
+        ratios = np.exp(D * log_odds)
+    total_weight = 0.0
+
+    # t counts MH steps of the equivalent rejecting chain
+    t = 0
+    while t < n_samples:
+        rate = 0.0
+        for b in range(n_bins):
+            rate += count[b] * accept[b]
+        A = rate / m
+        # Rejected proposals before the next accepted one: Geometric(A) failures
+        if A >= 1.0:
+            k = 0
+        else:
+            k = int(np.floor(np.log(1.0 - uniform()) / np.log1p(-A)))
+        occupy = min(k, n_samples - t)
+        post = min(t + occupy, n_samples) - max(t, burn_in)
+        if post > 0:
+            total_weight += w * post
+            if track:
+                Z_ratios += ratios * post
+        t += occupy
+        if t >= n_samples:
+            break
+
+        # The accepted move: bin with probability count * accept / rate, then uniform within it
+        r = uniform() * rate
+        b = n_bins - 1
+        for c in range(n_bins):
+            r -= count[c] * accept[c]
+            if r < 0 and count[c] > 0:
+                b = c
+                break
+        while count[b] == 0:
+            b -= 1
+        j = members[b, randint(0, count[b])]
+        is_X = j < n_X_stabs
+        _flip(eX, eZ, support, j, is_X)
+        w += b - max_w
+        if track and touches[j]:
+            _update_sector_offsets(eX, eZ, support, j, is_X, LX, LZ, D, ratios, log_odds)
+        for u in range(neighbours.shape[1]):
+            nb = neighbours[j, u]
+            if nb < 0:
+                break
+            nb_bin = _delta_weight(eX, eZ, support, nb, nb < n_X_stabs) + max_w
+            if nb_bin != cur_bin[nb]:
+                _bin_move(members, count, pos, cur_bin, nb, nb_bin)
+
+        if w * log_odds > best_logp:
+            best_logp = w * log_odds
+            best_eX[:] = eX
+            best_eZ[:] = eZ
+
+        # The accepting step itself is spent in the new state
+        if t >= burn_in:
+            total_weight += w
+            if track:
+                Z_ratios += ratios
+        t += 1
+
+    n_post = n_samples - burn_in
+    if n_post > 0:
+        avg_weight = total_weight / n_post
+        Z_ratios /= n_post
+    else:
+        avg_weight = float(w)
+    return avg_weight, best_eX, best_eZ, Z_ratios
+
+def _state(e):
+    return np.array(e, dtype=np.int64)
+
+def metropolis_hastings_joint(eX_init, eZ_init, support, n_X_stabs, q_error, n_samples, seed=None):
+    """Compiled counterpart of MH_sampler.metropolis_hastings_joint; takes a support table instead of all_stabs."""
+    log_odds = error_log_odds(q_error)
+    seed_kernels(seed_value(seed))
+    accept = acceptance_table(log_odds, support.shape[1])
+    return _joint_kernel(_state(eX_init), _state(eZ_init), support, n_X_stabs, accept, log_odds, int(n_samples))
+
+def metropolis_hastings_avg_weight(eX_init, eZ_init, support, n_X_stabs, q_error, n_samples, burn_in, seed=None):
+    """Compiled counterpart of MH_sampler.metropolis_hastings_avg_weight."""
+    log_odds = error_log_odds(q_error)
+    seed_kernels(seed_value(seed))
+    accept = acceptance_table(log_odds, support.shape[1])
+    return _avg_weight_kernel(_state(eX_init), _state(eZ_init), support, n_X_stabs, accept, log_odds,
+                              int(n_samples), int(burn_in))
+
+def metropolis_hastings_track_z(eX_init, eZ_init, support, n_X_stabs, q_error, n_samples, burn_in, logicals_X, logicals_Z, seed=None):
+    """Compiled counterpart of MH_sampler.metropolis_hastings_track_z."""
+    log_odds = error_log_odds(q_error)
+    seed_kernels(seed_value(seed))
+    accept = acceptance_table(log_odds, support.shape[1])
+    return _track_z_kernel(_state(eX_init), _state(eZ_init), support, n_X_stabs, accept, log_odds,
+                           int(n_samples), int(burn_in), _state(logicals_X), _state(logicals_Z))
+
+def metropolis_hastings_coset_probs(eX_init, eZ_init, support, n_X_stabs, q_error, n_samples, burn_in, logicals_X, logicals_Z, seed=None):
+    """Compiled counterpart of MH_sampler.metropolis_hastings_coset_probs."""
+    log_odds = error_log_odds(q_error)
+    seed_kernels(seed_value(seed))
+    accept = acceptance_table(log_odds, support.shape[1])
+    return _coset_probs_kernel(_state(eX_init), _state(eZ_init), support, n_X_stabs, accept, log_odds,
+                               int(n_samples), int(burn_in), _state(logicals_X), _state(logicals_Z))
+
+def metropolis_hastings_nfold_avg_weight(eX_init, eZ_init, support, neighbours, n_X_stabs, q_error, n_samples, burn_in, seed=None):
+    """
+    Rejection-free (n-fold way) counterpart of metropolis_hastings_avg_weight.
+    Moves are binned by their weight change, so the total acceptance rate is
+    a sum over 2 * max_weight + 1 bins; each iteration jumps straight to an
+    accepted move and advances the step count by a Geometric number of
+    rejections. After a flip only the bins of its neighbours
+    (neighbour_table) are updated. n_samples and burn_in count steps of the
+    ordinary chain, so the averages match metropolis_hastings_avg_weight
+    in distribution at a cost proportional to the accepted moves.
+    """
+    log_odds = error_log_odds(q_error)
+    seed_kernels(seed_value(seed))
+    accept = acceptance_table(log_odds, support.shape[1])
+    empty = np.zeros((0, len(eX_init)), dtype=np.int64)
+    avg_weight, best_eX, best_eZ, _ = _nfold_kernel(
+        _state(eX_init), _state(eZ_init), support, neighbours, n_X_stabs, accept, log_odds,
+        int(n_samples), int(burn_in), empty, empty, False
+    )
+    return avg_weight, best_eX, best_eZ
+
+def metropolis_hastings_nfold_track_z(eX_init, eZ_init, support, neighbours, n_X_stabs, q_error, n_samples, burn_in, logicals_X, logicals_Z, seed=None):
+    """Rejection-free counterpart of metropolis_hastings_track_z (see metropolis_hastings_nfold_avg_weight)."""
+    log_odds = error_log_odds(q_error)
+    seed_kernels(seed_value(seed))
+    accept = acceptance_table(log_odds, support.shape[1])
+    _, best_eX, best_eZ, Z_ratios = _nfold_kernel(
+        _state(eX_init), _state(eZ_init), support, neighbours, n_X_stabs, accept, log_odds,
+        int(n_samples), int(burn_in), _state(logicals_X), _state(logicals_Z), True
+    )
+    return best_eX, best_eZ, Z_ratios
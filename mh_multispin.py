@@ -0,0 +1,261 @@
+import numpy as np
+from mh_kernels import njit, seed_kernels, seed_value, error_log_odds, acceptance_table, uniform, randint
+
+REPLICAS = 64
+ALL_ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# De Bruijn table for the index of the lowest set bit of a uint64
+_DEBRUIJN = np.uint64(0x03F79D71B4CB0A89)
+_DEBRUIJN_TABLE = np.array([
+    0, 1, 48, 2, 57, 49, 28, 3, 61, 58, 50, 42, 38, 29, 17, 4,
+    62, 55, 59, 36, 53, 51, 43, 22, 45, 39, 33, 30, 24, 18, 12, 5,
+    63, 47, 56, 27, 60, 41, 37, 16, 54, 35, 52, 21, 44, 32, 23, 11,
+    46, 26, 40, 15, 34, 20, 31, 10, 25, 14, 19, 9, 13, 8, 7, 6,
+], dtype=np.int64)
+
+def pack_replicas(E):
+    """
+    Bit-slices up to 64 replicas: (R, n) 0/1 array -> (n,) uint64 words with
+    replica r in bit r.
+    """
+    E = np.asarray(E, dtype=np.uint8)
+    R, n = E.shape
+    padded = np.zeros((REPLICAS, n), dtype=np.uint8)
+    padded[:R] = E
+    return np.ascontiguousarray(np.packbits(padded.T, axis=1, bitorder='little')).view('<u8').ravel().astype(np.uint64)
+
+def unpack_replicas(words, R):
+    """Inverse of pack_replicas: (n,) uint64 -> (R, n) uint8."""
+    words = np.ascontiguousarray(words, dtype='<u8')
+    bits = np.unpackbits(words.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    return bits[:, :R].T.copy()
+
+def acceptance_masks(log_odds, max_weight, pool_size, rng):
+    """
+    Precomputed random bit masks: masks[d + max_weight, i] has bit r set with
+    probability min(1, exp(d * log_odds)). All deltas share the uniforms of
+    pool entry i, so one random index per step serves every replica.
+    """
+    accept = acceptance_table(log_odds, max_weight)
+    U = rng.random((pool_size, REPLICAS))
+    masks = np.empty((len(accept), pool_size), dtype=np.uint64)
+    for i, a in enumerate(accept):
+        masks[i] = np.packbits(U < a, axis=1, bitorder='little').view('<u8').ravel()
+    return masks
+
+def sector_tables(logicals_X, logicals_Z):
+    """
+    For every logical class k: the qubits where it differs from the trivial
+    class (padded with -1) and the X/Z parts of the logical on those qubits.
+    """
+    LX = np.asarray(logicals_X, dtype=np.uint8)
+    LZ = np.asarray(logicals_Z, dtype=np.uint8)
+    supports = [np.flatnonzero(LX[k] | LZ[k]) for k in range(len(LX))]
+    width = max(1, max(len(s) for s in supports))
+    idx = np.full((len(LX), width), -1, dtype=np.int64)
+    lx = np.zeros((len(LX), width), dtype=np.uint8)
+    lz = np.zeros((len(LX), width), dtype=np.uint8)
+    for k, s in enumerate(supports):
+        idx[k, :len(s)] = s
+        lx[k, :len(s)] = LX[k, s]
+        lz[k, :len(s)] = LZ[k, s]
+    return idx, lx, lz
+
+@njit
+def _lowest_bit(m):
+    return _DEBRUIJN_TABLE[((m & (~m + np.uint64(1))) * _DEBRUIJN) >> np.uint64(58)]
+
+@njit
+def _add_bit(planes, b):
+    # Bit-sliced increment of a per-replica counter by the bits of b
+    carry = b
+    for i in range(planes.shape[0]):
+        t = planes[i] & carry
+        planes[i] ^= carry
+        carry = t
+        if carry == 0:
+            break
+
+@njit
+def _plane_value(planes, r):
+    v = 0
+    for i in range(planes.shape[0]):
+        v |= int((planes[i] >> np.uint64(r)) & np.uint64(1)) << i
+    return v
+
+@njit
+def _snapshot(x, z, r, best_eX, best_eZ):
+    for q in range(x.shape[0]):
+        best_eX[r, q] = (x[q] >> np.uint64(r)) & np.uint64(1)
+        best_eZ[r, q] = (z[q] >> np.uint64(r)) & np.uint64(1)
+
+@njit
+def _multispin_kernel(x, z, n_rep, support, n_X_stabs, masks, log_odds, n_samples, burn_in,
+                      sec_idx, sec_lx, sec_lz, exp_table, track):
+    n = x.shape[0]
+    max_w = support.shape[1]
+    n_deltas = 2 * max_w + 1
+    pool_size = masks.shape[1]
+    live = ALL_ONES if n_rep == 64 else (np.uint64(1) << np.uint64(n_rep)) - np.uint64(1)
+
+    w = np.zeros(n_rep, dtype=np.int64)
+    for q in range(n):
+        m = (x[q] | z[q]) & live
+        while m != 0:
+            w[_lowest_bit(m)] += 1
+            m &= m - np.uint64(1)
+
+    best_logp = w * log_odds
+    best_eX = np.zeros((n_rep, n), dtype=np.uint8)
+    best_eZ = np.zeros((n_rep, n), dtype=np.uint8)
+    for r in range(n_rep):
+        _snapshot(x, z, r, best_eX, best_eZ)
+
+    total = np.zeros(n_rep)
+    K = sec_idx.shape[0]
+    Z_ratios = np.zeros((n_rep, K))
+    n_post = 0
+
+    plus = np.zeros(3, dtype=np.uint64)
+    minus = np.zeros(3, dtype=np.uint64)
+    n_planes = 1
+    while (1 << n_planes) <= sec_idx.shape[1]:
+        n_planes += 1
+    sec_plus = np.zeros(n_planes, dtype=np.uint64)
+    sec_minus = np.zeros(n_planes, dtype=np.uint64)
+    sec_off = sec_idx.shape[1]
+    eq = np.zeros(n_deltas, dtype=np.uint64)
+
+    for i in range(n_samples):
+        j = randint(0, support.shape[0])
+        is_X = j < n_X_stabs
+
+        # Per-replica weight change, bit-sliced over the support qubits
+        plus[:] = 0
+        minus[:] = 0
+        for t in range(max_w):
+            q = support[j, t]
+            if q < 0:
+                break
+            old = x[q] | z[q]
+            if is_X:
+                new = (~x[q]) | z[q]
+            else:
+                new = x[q] | (~z[q])
+            _add_bit(plus, new & ~old)
+            _add_bit(minus, old & ~new)
+
+        # Acceptance: one pool entry gives every replica its random bit for each delta
+        pick = randint(0, pool_size)
+        acc = np.uint64(0)
+        eq[:] = 0
+        for a in range(max_w + 1):
+            pa = (plus[0] if a & 1 else ~plus[0]) & (plus[1] if a & 2 else ~plus[1]) & (plus[2] if a & 4 else ~plus[2])
+            for b in range(max_w + 1):
+                mb = (minus[0] if b & 1 else ~minus[0]) & (minus[1] if b & 2 else ~minus[1]) & (minus[2] if b & 4 else ~minus[2])
+                eq[a - b + max_w] |= pa & mb
+        for d in range(n_deltas):
+            eq[d] &= masks[d, pick] & live
+            acc |= eq[d]
+
+        for t in range(max_w):
+            q = support[j, t]
+            if q < 0:
+                break
+            if is_X:
+                x[q] ^= acc
+            else:
+                z[q] ^= acc
+
+        # Per-replica bookkeeping only for accepted moves that change the weight
+        for d in range(n_deltas):
+            delta = d - max_w
+            m = eq[d]
+            if delta == 0:
+                continue
+            while m != 0:
+                r = _lowest_bit(m)
+                w[r] += delta
+                if w[r] * log_odds > best_logp[r]:
+                    best_logp[r] = w[r] * log_odds
+                    _snapshot(x, z, r, best_eX, best_eZ)
+                m &= m - np.uint64(1)
+
+        if i >= burn_in:
+            n_post += 1
+            for r in range(n_rep):
+                total[r] += w[r]
+            if track:
+                for k in range(K):
+                    sec_plus[:] = 0
+                    sec_minus[:] = 0
+                    for t in range(sec_idx.shape[1]):
+                        q = sec_idx[k, t]
+                        if q < 0:
+                            break
+                        lxm = ALL_ONES if sec_lx[k, t] else np.uint64(0)
+                        lzm = ALL_ONES if sec_lz[k, t] else np.uint64(0)
+                        old = x[q] | z[q]
+                        new = (x[q] ^ lxm) | (z[q] ^ lzm)
+                        _add_bit(sec_plus, new & ~old)
+                        _add_bit(sec_minus, old & ~new)
+                    for r in range(n_rep):
+                        diff = _plane_value(sec_plus, r) - _plane_value(sec_minus, r)
+                        Z_ratios[r, k] += exp_table[diff + sec_off]
+
+    if n_post > 0:
+        avg = total / n_post
+        Z_ratios /= n_post
+    else:
+        avg = w.astype(np.float64)
+    return avg, best_eX, best_eZ, Z_ratios
+
+def metropolis_hastings_multispin(eX_init, eZ_init, support, n_X_stabs, q_error, n_samples, burn_in,
+                                  logicals_X=None, logicals_Z=None, masks=None, pool_size=1 << 14, seed=None):
+    """
+    Multispin-coded MH: up to 64 replicas are stored bit-sliced in uint64
+    words, so a stabilizer flip is one XOR per support qubit for all replicas
+    and the weight change comes from bitwise ops over the support qubits.
+    Replicas share the proposed stabilizer of each step; acceptance uses
+    precomputed random bit masks per delta (acceptance_masks), so each
+    replica is an MH chain with the usual single-stabilizer moves.
+
+    eX_init, eZ_init: (R, n) replica states, R <= 64.
+    logicals_X/Z: optional logical classes; when given, the Z_ratios of
+    metropolis_hastings_track_z are accumulated for every replica.
+    masks: optional acceptance_masks pool to reuse across calls; a fresh pool
+    of pool_size entries is drawn otherwise.
+    Returns (avg_weights (R,), best_eX (R, n), best_eZ (R, n), Z_ratios (R, K)).
+    """
+    log_odds = error_log_odds(q_error)
+    eX_init = np.atleast_2d(eX_init)
+    eZ_init = np.atleast_2d(eZ_init)
+    R, n = eX_init.shape
+    if R > REPLICAS:
+        raise ValueError(f"At most {REPLICAS} replicas per word, got {R}")
+    if support.shape[1] > 7:
+        raise ValueError("Multispin weight counters support stabilizers of weight at most 7")
+
+    seed = seed_value(seed)
+    seed_kernels(seed)
+    if masks is None:
+        masks = acceptance_masks(log_odds, support.shape[1], pool_size, np.random.default_rng(seed))
+
+    track = logicals_X is not None
+    if track:
+        sec_idx, sec_lx, sec_lz = sector_tables(logicals_X, logicals_Z)
+    else:
+        sec_idx = np.full((0, 1), -1, dtype=np.int64)
+        sec_lx = np.zeros((0, 1), dtype=np.uint8)
+        sec_lz = np.zeros((0, 1), dtype=np.uint8)
+    width = sec_idx.shape[1]
+    exp_table = np.exp(np.arange(-width, width + 1) * log_odds)
+
+    x = pack_replicas(eX_init)
+    z = pack_replicas(eZ_init)
+    with np.errstate(over='ignore'):
+        avg, best_eX, best_eZ, Z_ratios = _multispin_kernel(
+            x, z, R, support, n_X_stabs, masks, log_odds, int(n_samples), int(burn_in),
+            sec_idx, sec_lx, sec_lz, exp_table, track
+        )
+    return avg, best_eX.astype(int), best_eZ.astype(int), Z_ratios
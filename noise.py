@@ -1,4 +1,5 @@
 import random
+import numpy as np
 
 def depolarizing_noise(n, p):
     eX = [0]*n
@@ -19,4 +20,56 @@ def independent_XZ_noise(n, p):
             eX[i] = 1
         if random.random() < p:
             eZ[i] = 1
-    return eX, eZ
\ No newline at end of file
+    return eX, eZ
+
+def depolarizing_noise_batch(n, p, shots, rng=None):
+    """
+    Batched depolarizing noise. Returns (eX, eZ) as (shots, n) uint8 arrays.
+    rng may be a seed or a numpy Generator.
+    """
+    rng = np.random.default_rng(rng)
+    # One uniform draw per qubit: [0, p/3) -> X, [p/3, 2p/3) -> Y, [2p/3, p) -> Z
+    r = rng.random((shots, n))
+    eX = (r < 2 * p / 3).astype(np.uint8)
+    eZ = ((r >= p / 3) & (r < p)).astype(np.uint8)
+    return eX, eZ
+
+def independent_XZ_noise_batch(n, p, shots, rng=None):
+    """
+    Batched independent X/Z noise. Returns (eX, eZ) as (shots, n) uint8 arrays.
+    """
+    rng = np.random.default_rng(rng)
+    eX = (rng.random((shots, n)) < p).astype(np.uint8)
+    eZ = (rng.random((shots, n)) < p).astype(np.uint8)
+    return eX, eZ
+
+def _geometric_skip_indices(n, p, rng):
+    # Positions of Bernoulli(p) successes among n trials via geometric gaps.
+    if p <= 0:
+        return np.empty(0, dtype=np.int64)
+    if p >= 1:
+        return np.arange(n, dtype=np.int64)
+    chunk = int(n * p + 4 * np.sqrt(n * p) + 16)
+    out = []
+    pos = -1
+    while True:
+        gaps = rng.geometric(p, size=chunk)
+        idx = pos + np.cumsum(gaps)
+        out.append(idx[idx < n])
+        if idx[-1] >= n:
+            break
+        pos = idx[-1]
+    return np.concatenate(out)
+
+def sparse_depolarizing_noise(n, p, rng=None):
+    """
+    Depolarizing noise as flipped-index lists (flipX, flipZ) instead of dense
+    vectors. Cost scales with p*n.
+    """
+    rng = np.random.default_rng(rng)
+    flipped = _geometric_skip_indices(n, p, rng)
+    # 0 -> X, 1 -> Y, 2 -> Z
+    pauli = rng.integers(0, 3, size=len(flipped))
+    flipX = flipped[pauli != 2]
+    flipZ = flipped[pauli != 0]
+    return flipX, flipZ
@@ -1,12 +1,14 @@
-from noise import depolarizing_noise
-from syndrome import syndrome_from_eX, syndrome_from_eZ
+import numpy as np
+import random
+from noise import depolarizing_noise, depolarizing_noise_batch, sparse_depolarizing_noise
+from syndrome import syndrome_batch_from_eX, syndrome_batch_from_eZ, defects_from_flips
 from logical import logical_parity 
 
 def run_trial(code, p, decoder):
     eX, eZ = depolarizing_noise(code.n, p)
 
-    sZ = syndrome_from_eX(eX, code.Z_stabilizers)
-    sX = syndrome_from_eZ(eZ, code.X_stabilizers)
+    sZ = syndrome_batch_from_eX(eX, code)[0]
+    sX = syndrome_batch_from_eZ(eZ, code)[0]
 
     eX_hat, eZ_hat = decoder.decode(sZ, sX)
 
@@ -21,3 +23,76 @@ def run_trial(code, p, decoder):
     fail_Z2 = logical_parity(rZ, code.logical_X_conjugate())
 
     return fail_X1 or fail_Z1 or fail_X2 or fail_Z2
+
+def run_trial_sparse(code, p, decoder, rng=None):
+    """
+    Low-p variant of run_trial that works on flipped-index lists throughout.
+    decoder must provide decode_defects (e.g. MWPMDecoder). rng defaults to
+    a Generator seeded from the random module, as in run_batch.
+    """
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+    adjZ, adjX = code.qubit_stabilizer_incidence()
+
+    flipX, flipZ = sparse_depolarizing_noise(code.n, p, rng)
+
+    defectsZ = defects_from_flips(flipX, adjZ)
+    defectsX = defects_from_flips(flipZ, adjX)
+
+    flipX_hat, flipZ_hat = decoder.decode_defects(defectsZ, defectsX)
+
+    rX = np.setxor1d(flipX, flipX_hat)
+    rZ = np.setxor1d(flipZ, flipZ_hat)
+
+    # Residual parity on a logical support = overlap count mod 2, read off
+    # the cached indicator rows at the residual's indices only
+    LZ, LX = code.logical_indicators()
+    fail_X = (LZ[:, rX].sum(axis=1) & 1).any()
+    fail_Z = (LX[:, rZ].sum(axis=1) & 1).any()
+
+    return bool(fail_X or fail_Z)
+
+def run_batch(code, p, decoder, shots, rng=None):
+    """
+    Whole-batch version of run_trial: noise, syndromes, residuals and logical
+    checks are all array operations over `shots` shots. Decoders with a
+    decode_batch method decode the batch in one call, others shot by shot.
+
+    Returns (failures, n_fail_X, n_fail_Z), where failures is a (shots,) bool
+    array and n_fail_X / n_fail_Z count shots with a logical X- / Z-error
+    failure. rng defaults to a Generator seeded from the random module, so
+    seeding random reproduces a run as it does for run_trial.
+    """
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+    eX, eZ = depolarizing_noise_batch(code.n, p, shots, rng)
+
+    sZ = syndrome_batch_from_eX(eX, code)
+    sX = syndrome_batch_from_eZ(eZ, code)
+
+    if hasattr(decoder, 'decode_batch'):
+        eX_hat, eZ_hat = decoder.decode_batch(sZ, sX)
+    else:
+        eX_hat = np.empty_like(eX)
+        eZ_hat = np.empty_like(eZ)
+        for i in range(shots):
+            eX_hat[i], eZ_hat[i] = decoder.decode(sZ[i], sX[i])
+
+    rX = eX ^ np.asarray(eX_hat, dtype=np.uint8)
+    rZ = eZ ^ np.asarray(eZ_hat, dtype=np.uint8)
+
+    # Check X errors against Z logical operators and Z errors against X ones
+    LZ = _logical_check_matrix([code.logical_Z_support(), code.logical_Z_conjugate()], code.n)
+    LX = _logical_check_matrix([code.logical_X_support(), code.logical_X_conjugate()], code.n)
+    fail_X = ((rX @ LZ.T) & 1).any(axis=1)
+    fail_Z = ((rZ @ LX.T) & 1).any(axis=1)
+
+    return fail_X | fail_Z, int(fail_X.sum()), int(fail_Z.sum())
+
+def _logical_check_matrix(supports, n):
+    # Rows are indicator vectors of the non-empty logical supports
+    supports = [s for s in supports if s]
+    M = np.zeros((len(supports), n), dtype=np.int64)
+    for i, s in enumerate(supports):
+        M[i, s] = 1
+    return M
@@ -5,3 +5,45 @@ def syndrome_from_eX(eX, Z_stabilizers):
 
 def syndrome_from_eZ(eZ, X_stabilizers):
     return np.array([sum(eZ[q] for q in stab) % 2 for stab in X_stabilizers])
+
+def qubit_stabilizer_adjacency(stabilizers, n):
+    """
+    (n, max_degree) int array listing the stabilizers acting on each qubit,
+    padded with -1.
+    """
+    degree = np.zeros(n, dtype=np.int64)
+    for stab in stabilizers:
+        for q in stab:
+            degree[q] += 1
+    adj = np.full((n, max(int(degree.max()), 1)), -1, dtype=np.int64)
+    fill = np.zeros(n, dtype=np.int64)
+    for i, stab in enumerate(stabilizers):
+        for q in stab:
+            adj[q, fill[q]] = i
+            fill[q] += 1
+    return adj
+
+def defects_from_flips(flips, adjacency):
+    """
+    Sparse syndrome: sorted indices of the stabilizers that anticommute with
+    the error whose support is `flips`.
+    """
+    touched = adjacency[np.asarray(flips, dtype=np.int64)].ravel()
+    touched = touched[touched >= 0]
+    stabs, counts = np.unique(touched, return_counts=True)
+    return stabs[counts % 2 == 1]
+
+def syndrome_batch_from_eX(eX, code):
+    """(shots, n) X errors -> (shots, mZ) Z-stabilizer syndromes."""
+    HZ, _ = code.parity_check_matrices()
+    return _syndrome_batch(np.asarray(eX, dtype=np.uint8), HZ)
+
+def syndrome_batch_from_eZ(eZ, code):
+    """(shots, n) Z errors -> (shots, mX) X-stabilizer syndromes."""
+    _, HX = code.parity_check_matrices()
+    return _syndrome_batch(np.asarray(eZ, dtype=np.uint8), HX)
+
+def _syndrome_batch(E, H):
+    # One sparse product for the whole batch; row weights are small so uint8 cannot overflow
+    S = H.dot(np.atleast_2d(E).T).T
+    return np.ascontiguousarray(S & 1, dtype=np.uint8)
@@ -0,0 +1,34 @@
+import numpy as np
+import utils
+from code import ToricCode, PlanarSurfaceCode
+from MH_sampler import metropolis_hastings_adaptive_avg_weight
+
+def _setup(code, q, seed):
+    rng = np.random.default_rng(seed)
+    e = rng.random(code.n) < 1.5 * q
+    kind = rng.integers(0, 3, code.n)
+    eX = (e & (kind != 2)).astype(int)
+    eZ = (e & (kind != 0)).astype(int)
+    sectors = utils.generate_all_sectors(eX, eZ, code)
+    # Exact mean weight of every sector under pi(e) ~ (q / (1 - q))^w(e)
+    A = utils.sector_weight_enums(eX, eZ, code)
+    w = np.arange(code.n + 1)
+    r = (q / (1 - q)) ** w
+    return sectors, (A * r * w).sum(axis=1) / (A * r).sum(axis=1)
+
+def test_adaptive_avg_weight_matches_enumeration():
+    # Early stopping on the draws it averages biased the mean weight by ~2 SE
+    for code in (ToricCode(3), PlanarSurfaceCode(3)):
+        sectors, exact = _setup(code, 0.1, seed=2)
+        # Four classes keep the toric run short
+        sectors, exact = sectors[:4], exact[:4]
+        sX = np.array([s[0] for s in sectors])
+        sZ = np.array([s[1] for s in sectors])
+        runs = np.array([
+            metropolis_hastings_adaptive_avg_weight(sX, sZ, code.support_table(), len(code.X_stabilizers),
+                                                    0.1, 20000, 200, rng=seed)[0]
+            for seed in range(20)
+        ])
+        err = runs - exact
+        se = err.std(axis=0, ddof=1) / np.sqrt(len(runs))
+        assert np.all(np.abs(err.mean(axis=0)) < 4 * se + 1e-9)
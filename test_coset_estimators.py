@@ -0,0 +1,28 @@
+import numpy as np
+import utils
+from code import ToricCode, PlanarSurfaceCode
+from MH_sampler import metropolis_hastings_coset_estimators
+
+def _setup(code, p, seed):
+    rng = np.random.default_rng(seed)
+    e = rng.random(code.n) < p
+    kind = rng.integers(0, 3, code.n)
+    eX = (e & (kind != 2)).astype(int)
+    eZ = (e & (kind != 0)).astype(int)
+    sectors = utils.generate_all_sectors(eX, eZ, code)
+    logicals_X = [sX ^ eX for sX, _ in sectors]
+    logicals_Z = [sZ ^ eZ for _, sZ in sectors]
+    exact = utils.weight_distr(utils.sector_weight_enums(eX, eZ, code), code.n, p)
+    return eX, eZ, logicals_X, logicals_Z, exact / exact.sum()
+
+def test_coset_estimators_match_enumeration():
+    # Batch-means errors were ~10x too small; the jackknife over replicates
+    # must cover the deviation from the exact coset probabilities
+    p = 0.3
+    for code in (ToricCode(3), PlanarSurfaceCode(3)):
+        eX, eZ, logicals_X, logicals_Z, exact = _setup(code, p, seed=2)
+        est = metropolis_hastings_coset_estimators(
+            eX, eZ, code.support_table(), len(code.X_stabilizers), p / (3 - 2 * p), 4000, 1000,
+            logicals_X, logicals_Z, rng=1)
+        for name in ('naive', 'bar', 'rb'):
+            assert np.all(np.abs(est[name] - exact) < 5 * est[name + '_se'] + 0.01), name
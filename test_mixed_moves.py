@@ -0,0 +1,53 @@
+import random
+import numpy as np
+import utils
+import mh_kernels
+from code import ToricCode, PlanarSurfaceCode
+from MH_sampler import ProposalMoves, metropolis_hastings_avg_weight, metropolis_hastings_mixed_avg_weight
+
+def _setup(code, p, seed):
+    rng = np.random.default_rng(seed)
+    e = rng.random(code.n) < p
+    kind = rng.integers(0, 3, code.n)
+    eX = (e & (kind != 2)).astype(int)
+    eZ = (e & (kind != 0)).astype(int)
+    q = p / (3 - 2 * p)
+    # Exact mean weight of the coset under pi(e) ~ (q / (1 - q))^w(e)
+    A = utils.coset_weight_enum(eX, eZ, code)
+    w = np.arange(len(A))
+    r = q / (1 - q)
+    exact = (A * w * r ** w).sum() / (A * r ** w).sum()
+    return eX, eZ, q, exact
+
+def _chain_means(run, n_chains):
+    means = []
+    for seed in range(n_chains):
+        random.seed(seed)
+        means.append(run())
+    means = np.array(means)
+    return means.mean(), means.std(ddof=1) / np.sqrt(n_chains)
+
+def test_block_moves_are_four_cycles():
+    # L = 5 so no straight 4-cycle wraps around the torus
+    code = ToricCode(5)
+    moves = ProposalMoves(mh_kernels.code_support_table(code), len(code.X_stabilizers))
+    # One 2x2 block per lattice site and stabilizer type on the torus
+    assert len(moves.block_moves) == 2 * code.L ** 2
+    assert all(len(flips) == 8 for flips, _ in moves.block_moves)
+
+def test_mixed_matches_reference_sampler():
+    for code in (ToricCode(3), PlanarSurfaceCode(3)):
+        eX, eZ, q, exact = _setup(code, 0.08, seed=5)
+        support = mh_kernels.code_support_table(code)
+        n_X_stabs = len(code.X_stabilizers)
+        moves = ProposalMoves(support, n_X_stabs)
+        stabs = [np.isin(np.arange(code.n), s).astype(int) for s in code.X_stabilizers + code.Z_stabilizers]
+
+        ref_mean, ref_se = _chain_means(
+            lambda: metropolis_hastings_avg_weight(eX, eZ, stabs, n_X_stabs, q, 5000, 1000)[0], 12)
+        mixed_mean, mixed_se = _chain_means(
+            lambda: metropolis_hastings_mixed_avg_weight(eX, eZ, moves, q, 5000, 1000)[0], 12)
+
+        assert abs(ref_mean - exact) < 4 * ref_se + 1e-9
+        assert abs(mixed_mean - exact) < 4 * mixed_se + 1e-9
+        assert abs(mixed_mean - ref_mean) < 4 * np.hypot(ref_se, mixed_se) + 1e-9
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+import utils
+from code import ToricCode, PlanarSurfaceCode
+from decoder import MLDecoder
+
+def _error(code, p, seed):
+    rng = np.random.default_rng(seed)
+    e = rng.random(code.n) < p
+    kind = rng.integers(0, 3, code.n)
+    return (e & (kind != 2)).astype(int), (e & (kind != 0)).astype(int)
+
+def _check_against_enumeration(code, p, seed, n_workers=None):
+    eX, eZ = _error(code, p, seed)
+    exact = utils.weight_distr(utils.sector_weight_enums(eX, eZ, code, n_workers), code.n, p)
+    log_probs, _ = MLDecoder(code, p).coset_log_probs(eX, eZ)
+    np.testing.assert_allclose(log_probs, np.log(exact), rtol=0, atol=1e-8)
+
+def test_planar_default_chi_is_exact():
+    for L in (3, 4):
+        _check_against_enumeration(PlanarSurfaceCode(L), 0.12, seed=L)
+
+def test_toric_l3_default_chi_is_exact():
+    _check_against_enumeration(ToricCode(3), 0.12, seed=3)
+
+@pytest.mark.slow
+def test_toric_l4_default_chi_is_exact():
+    # 2^30 group elements: several minutes of enumeration
+    _check_against_enumeration(ToricCode(4), 0.12, seed=4, n_workers=0)
@@ -1,5 +1,7 @@
 import numpy as np
+import os
 from itertools import product
+from concurrent.futures import ProcessPoolExecutor
 from scipy import sparse
 from qiskit.quantum_info import SparsePauliOp
 try:
@@ -54,18 +56,86 @@ def pauli_list_to_binary_pair(plist):
 def syndrome_from_eZ(eZ, HX):
     return (HX.dot(eZ) % 2).astype(int)'''
 
-def mwpm_initialize_e_given_syndrome(H, syndrome):
+def build_matching(H):
+    """
+    Builds the pymatching graph for H once so it can be reused across
+    decodes. Returns None when pymatching is unavailable.
+    """
+    if not _HAVE_PYMATCHING:
+        return None
+    return pymatching.Matching(sparse.csr_matrix(H))
+
+def mwpm_initialize_e_given_syndrome(H, syndrome, matching=None):
     m, n = H.shape
     if _HAVE_PYMATCHING:
-        Ms = sparse.csr_matrix(H)
-        M = pymatching.Matching(Ms)
-        e = M.decode(syndrome.tolist())
+        M = matching if matching is not None else build_matching(H)
+        e = M.decode(np.asarray(syndrome, dtype=np.uint8))
         e = np.array(e, dtype=int)
         return e
     else:
         # fallback: simple gaussian elimination mod 2 to find a particular solution
+        if sparse.issparse(H):
+            H = H.toarray()
         e= ge_initialize_given_syndrome(H, syndrome)
         return e
+
+def mwpm_decode_batch(H, syndromes, matching=None):
+    """
+    Decodes a (shots, m) array of syndromes, returning (shots, n) uint8
+    corrections. Uses pymatching's batch decoding when available.
+    """
+    syndromes = np.atleast_2d(np.asarray(syndromes, dtype=np.uint8))
+    if _HAVE_PYMATCHING:
+        M = matching if matching is not None else build_matching(H)
+        return M.decode_batch(syndromes).astype(np.uint8)
+    if sparse.issparse(H):
+        H = H.toarray()
+    out = np.zeros((syndromes.shape[0], H.shape[1]), dtype=np.uint8)
+    for i, s in enumerate(syndromes):
+        out[i] = ge_initialize_given_syndrome(H, s)
+    return out
+
+def matching_edge_qubits(matching):
+    """
+    {(u, v): qubit} for the edges of a matching graph built from a check
+    matrix, with u < v, and v = -1 for edges to the boundary.
+    """
+    boundary = matching.boundary
+    table = {}
+    for u, v, data in matching.edges():
+        if v is None or v in boundary:
+            key = (u, -1)
+        elif u in boundary:
+            key = (v, -1)
+        else:
+            key = (min(u, v), max(u, v))
+        table[key] = min(data['fault_ids'])
+    return table
+
+def mwpm_decode_defects(H, defects, matching=None, edge_qubits=None):
+    """
+    MWPM on a sparse syndrome: sorted defect (stabilizer) indices in, sorted
+    flipped-qubit indices out. With pymatching the defects go straight to the
+    matching graph as detection events and the matched edges are mapped to
+    qubits, so the cost scales with the number of defects rather than with
+    H's size; without it this falls back to a dense solve.
+    """
+    defects = np.asarray(defects, dtype=np.int64)
+    if len(defects) == 0:
+        return np.empty(0, dtype=np.int64)
+    if not _HAVE_PYMATCHING:
+        syndrome = np.zeros(H.shape[0], dtype=np.uint8)
+        syndrome[defects] = 1
+        return np.flatnonzero(mwpm_initialize_e_given_syndrome(H, syndrome))
+    M = matching if matching is not None else build_matching(H)
+    table = edge_qubits if edge_qubits is not None else matching_edge_qubits(M)
+    # Matching.decode_to_edges_array would want a dense syndrome; the graph takes the indices
+    edges = M._matching_graph.decode_to_edges_array(defects)
+    # A qubit on two matched paths cancels
+    flips = set()
+    for u, v in edges.tolist():
+        flips.symmetric_difference_update((table[(min(u, v), max(u, v)) if v >= 0 else (u, -1)],))
+    return np.array(sorted(flips), dtype=np.int64)
     
 def ge_initialize_given_syndrome(H, syndrome):
     m, n = H.shape
@@ -98,49 +168,109 @@ def ge_initialize_given_syndrome(H, syndrome):
         x[c] = A[i_row, -1]  # RHS
     return x
 
-def coset_weight_enum(eX, eZ, code):
-    n = code.n
+# Stabilizer-group enumeration: the low _CHUNK_BITS generators form a
+# Gray-code table evaluated as one vectorized chunk, the remaining generators
+# are walked in Gray-code order so each chunk differs from the last by one flip.
+_CHUNK_BITS = 16
+
+if hasattr(np, 'bitwise_count'):
+    _popcount = np.bitwise_count
+else:
+    _BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _popcount(words):
+        return _BYTE_COUNTS[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+def _pack_words(v):
+    # 0/1 vectors (..., n) -> (..., ceil(n / 64)) uint64 words
+    v = np.asarray(v, dtype=np.uint8)
+    pad = np.zeros(v.shape[:-1] + ((-v.shape[-1]) % 64,), dtype=np.uint8)
+    return np.ascontiguousarray(np.packbits(np.concatenate([v, pad], axis=-1), axis=-1, bitorder='little')).view('<u8')
+
+def _gray_table(gens):
+    # XOR of every subset of gens in reflected Gray-code order (one flip per row)
+    table = np.zeros((1,) + gens.shape[1:], dtype=np.uint64)
+    for g in gens:
+        table = np.concatenate([table, table[::-1] ^ g])
+    return table
+
+def _stabilizer_generators(code):
+    # (m, 2, W) packed (x, z) parts of the independent stabilizer generators.
     # Toric codes have one redundant X and Z stabilizer; Planar codes do not.
     is_toric = code.__class__.__name__ == 'ToricCode'
     X_stabs = code.X_stabilizers[:-1] if is_toric else code.X_stabilizers
     Z_stabs = code.Z_stabilizers[:-1] if is_toric else code.Z_stabilizers
-    
-    # Convert index-based stabilizers to binary vectors
-    X_vecs = []
-    for stab in X_stabs:
-        v = np.zeros(n, dtype=int)
-        v[stab] = 1
-        X_vecs.append(v)
-
-    Z_vecs = []
-    for stab in Z_stabs:
-        v = np.zeros(n, dtype=int)
-        v[stab] = 1
-        Z_vecs.append(v)
-
-    A = np.zeros(n + 1, dtype=np.int64)
-    eX_arr, eZ_arr = np.array(eX), np.array(eZ)
-
-    # Iterate through all possible stabilizer combinations
-    for xb in product([0, 1], repeat=len(X_vecs)):
-        xs = np.zeros(n, dtype=int)
-        for b, v in zip(xb, X_vecs):
-            if b: xs ^= v
-            
-        for zb in product([0, 1], repeat=len(Z_vecs)):
-            zs = np.zeros(n, dtype=int)
-            for b, v in zip(zb, Z_vecs):
-                if b: zs ^= v
-
-            # Compute weight using the existing utility function
-            w = np.sum(((eX_arr ^ xs) | (eZ_arr ^ zs)))#weight(eX_arr ^ xs, eZ_arr ^ zs)
-            A[w] += 1
-
-    return A
-
-def coset_weight_distr(eX, eZ, code, p):
+    gens = np.zeros((len(X_stabs) + len(Z_stabs), 2, code.n), dtype=np.uint8)
+    for i, stab in enumerate(X_stabs):
+        gens[i, 0, stab] = 1
+    for i, stab in enumerate(Z_stabs):
+        gens[len(X_stabs) + i, 1, stab] = 1
+    return _pack_words(gens)
+
+def _enum_range(gens, e, n, start, stop):
+    # (K, n + 1) weight counts of the K representatives e (K, 2, W) over the
+    # high Gray-code indices [start, stop)
+    low_bits = min(len(gens), _CHUNK_BITS)
+    # (2, W, chunk) so every word of the chunk is one contiguous row
+    table = np.ascontiguousarray(_gray_table(gens[:low_bits]).transpose(1, 2, 0))
+    high = gens[low_bits:]
+    offset = e.copy()
+    g = start ^ (start >> 1)
+    for i in range(len(high)):
+        if (g >> i) & 1:
+            offset ^= high[i]
+    K, _, W = e.shape
+    shift = (n + 1) * np.arange(K, dtype=np.int64)[:, None]
+    A = np.zeros(K * (n + 1), dtype=np.int64)
+    for s in range(start, stop):
+        if s > start:
+            # Gray codes of s - 1 and s differ in the lowest set bit of s
+            offset ^= high[(s & -s).bit_length() - 1]
+        # Every representative against the same chunk of group elements
+        w = shift.copy()
+        for j in range(W):
+            w = w + _popcount((table[0, j] ^ offset[:, 0, j, None]) | (table[1, j] ^ offset[:, 1, j, None]))
+        A += np.bincount(w.ravel(), minlength=K * (n + 1))
+    return A.reshape(K, n + 1)
+
+def _weight_enums(e, code, n_workers):
+    gens = _stabilizer_generators(code)
+    n_high = 1 << max(0, len(gens) - _CHUNK_BITS)
+    if n_workers is None:
+        return _enum_range(gens, e, code.n, 0, n_high)
+
+    n_workers = (os.cpu_count() or 1) if n_workers == 0 else n_workers
+    bounds = np.linspace(0, n_high, min(n_workers, n_high) + 1).astype(int)
+    with ProcessPoolExecutor(max_workers=len(bounds) - 1) as pool:
+        parts = pool.map(_enum_range, *zip(*[(gens, e, code.n, int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])]))
+        return np.sum(list(parts), axis=0)
+
+def coset_weight_enum(eX, eZ, code, n_workers=None):
+    """
+    Weight enumerator A[w] of the coset of (eX, eZ): the number of
+    stabilizer-equivalent errors of weight w. n_workers: None enumerates in
+    this process, an int (or 0 for os.cpu_count()) splits the Gray-code
+    walk across that many processes.
+    """
+    return _weight_enums(_pack_words(np.array([[eX, eZ]])), code, n_workers)[0]
+
+def sector_weight_enums(eX, eZ, code, n_workers=None):
+    """
+    Weight enumerators of every logical sector of (eX, eZ), in the order of
+    generate_all_sectors, as a (K, n + 1) array. The stabilizer group is
+    walked once, with all K representatives evaluated per chunk.
+    """
+    sectors = generate_all_sectors(eX, eZ, code)
+    return _weight_enums(_pack_words(np.array([[sX, sZ] for sX, sZ in sectors])), code, n_workers)
+
+def weight_distr(A, n, p):
+    """Probability sum_w A[..., w] (p/3)^w (1-p)^(n-w) of weight enumerators A."""
+    w = np.arange(n + 1)
+    return np.asarray(A) @ ((p / 3) ** w * (1 - p) ** (n - w))
+
+def coset_weight_distr(eX, eZ, code, p, n_workers=None):
     n = code.n
-    A = coset_weight_enum(eX, eZ, code)
+    A = coset_weight_enum(eX, eZ, code, n_workers)
     P_coset = 0
     for w, count in enumerate(A):
         P_coset += count * ((p/3)**w) * ((1-p)**(n-w)) 